@@ -5,7 +5,16 @@ from dotenv import load_dotenv
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-conn = psycopg2.connect(DATABASE_URL)
+conn = psycopg2.connect(
+    DATABASE_URL,
+    connect_timeout=3,
+    keepalives=1,
+    keepalives_idle=5,
+    keepalives_interval=2,
+    keepalives_count=3,
+    application_name='check_952782',
+    options='-c statement_timeout=15000',
+)
 cur = conn.cursor()
 
 cur.execute('SELECT id, "addressId" FROM employees WHERE id = %s', ('952782',))
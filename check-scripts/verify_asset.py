@@ -5,18 +5,27 @@ from dotenv import load_dotenv
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-conn = psycopg2.connect(DATABASE_URL)
+conn = psycopg2.connect(
+    DATABASE_URL,
+    connect_timeout=3,
+    keepalives=1,
+    keepalives_idle=5,
+    keepalives_interval=2,
+    keepalives_count=3,
+    application_name='verify_asset',
+    options='-c statement_timeout=15000',
+)
 cur = conn.cursor()
 
 cur.execute('''
     SELECT 
-        a."serialNumber", 
+        a."serialCode", 
         e."addressId", 
         addr.country 
     FROM assets a 
     LEFT JOIN employees e ON a."assignedToId" = e.id 
     LEFT JOIN addresses addr ON e."addressId" = addr.id 
-    WHERE a."serialNumber" = %s
+    WHERE a."serialCode" = %s
 ''', ('LQWQG0VMH3',))
 
 row = cur.fetchone()
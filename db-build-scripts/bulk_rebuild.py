@@ -0,0 +1,91 @@
+"""
+Rebuild Offices, Orders and Offboards in One Transaction
+
+This script fetches office, order and offboard data from the Workwize API and
+loads all three tables over a single PostgreSQL connection, committing once at
+the end. Employees must already be populated, since offboards are checked
+against the employees table.
+
+Usage:
+    python bulk_rebuild.py
+"""
+
+import sys
+import requests
+import psycopg2
+
+import populate_offboards
+import populate_offices
+import populate_orders
+from populate_offices import DATABASE_URL, WORKWIZE_KEY
+
+# Populators in dependency order
+POPULATORS = [
+    ('offices', populate_offices.fetch_offices, populate_offices.populate_offices),
+    ('orders', populate_orders.fetch_orders, populate_orders.populate_orders),
+    ('offboards', populate_offboards.fetch_offboards, populate_offboards.populate_offboards),
+]
+
+
+def rebuild(conn, datasets):
+    """Load each fetched dataset through its populator in one transaction on conn."""
+    cursor = conn.cursor()
+    try:
+        # A rebuild can simply be rerun, so don't wait for the WAL flush on commit
+        cursor.execute("SET LOCAL synchronous_commit = off")
+    finally:
+        cursor.close()
+
+    for name, populate, records in datasets:
+        print(f"\n{'-' * 60}\nLoading {name}\n{'-' * 60}")
+        if not records:
+            print(f"⚠️  No {name} found in API response")
+            continue
+        populate(conn, records)
+
+
+def main():
+    """Main execution function."""
+    print("=" * 60)
+    print("Workwize Bulk Rebuild Script")
+    print("=" * 60)
+
+    # Validate environment variables
+    if not WORKWIZE_KEY:
+        print("❌ Error: WORKWIZE_KEY not found in environment variables")
+        sys.exit(1)
+
+    if not DATABASE_URL:
+        print("❌ Error: DATABASE_URL not found in environment variables")
+        sys.exit(1)
+
+    try:
+        # Fetch everything before opening the transaction
+        datasets = [(name, populate, fetch()) for name, fetch, populate in POPULATORS]
+
+        conn = psycopg2.connect(DATABASE_URL)
+        try:
+            rebuild(conn, datasets)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error rebuilding tables: {e}")
+            raise
+        finally:
+            conn.close()
+
+        print("\n✅ Bulk rebuild complete!")
+
+    except requests.RequestException as e:
+        print(f"❌ API Error: {e}")
+        sys.exit(1)
+    except psycopg2.Error as e:
+        print(f"❌ Database Error: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Unexpected Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
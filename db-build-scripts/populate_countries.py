@@ -32,15 +32,21 @@ WORKWIZE_BASE_URL = 'https://prod-back.goworkwize.com/api/public'
 # Rate limiting
 DELAY_BETWEEN_REQUESTS = 0.1  # 100ms delay to avoid overwhelming API
 
+# Rows per round trip when streaming employee IDs from the database
+EMPLOYEE_ID_FETCH_SIZE = 10000
+
 
 def get_employee_ids():
     """Get all employee IDs from the database."""
     conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
+    # Server-side cursor so the IDs stream in batches instead of being
+    # buffered client-side all at once
+    cursor = conn.cursor(name='employee_ids')
+    cursor.itersize = EMPLOYEE_ID_FETCH_SIZE
     
     try:
         cursor.execute('SELECT id FROM employees ORDER BY id')
-        employee_ids = [row[0] for row in cursor.fetchall()]
+        employee_ids = [row[0] for row in cursor]
         return employee_ids
     finally:
         cursor.close()
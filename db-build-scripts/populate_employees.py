@@ -11,7 +11,12 @@ Usage:
 import os
 import sys
 import re
+import operator
+import dbm
+import shelve
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import psycopg2
 from psycopg2.extras import execute_values
 from datetime import datetime
@@ -19,7 +24,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 import time
 import urllib3
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 # Suppress InsecureRequestWarning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -33,6 +38,72 @@ WORKWIZE_KEY = os.getenv('WORKWIZE_KEY')
 DATABASE_URL = os.getenv('DATABASE_URL')
 WORKWIZE_BASE_URL = 'https://prod-back.goworkwize.com/api/public'
 
+# Concurrent address lookups
+ADDRESS_WORKERS = 10
+
+# Address lookups queued ahead of the workers; bounds how far page fetching
+# runs ahead of the lookups and DB writes
+ADDRESS_WINDOW = 4 * ADDRESS_WORKERS
+
+# Shared HTTP session: default headers are set once and the pool is sized so
+# every address worker keeps its own keep-alive connection to the API
+SESSION = requests.Session()
+SESSION.headers.update({
+    'Authorization': f'Bearer {WORKWIZE_KEY}',
+    'Accept': 'application/json'
+})
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=ADDRESS_WORKERS))
+
+# ETag cache for the addresses endpoint so reruns can use conditional GETs.
+# Maps employee ID -> {'etag': ..., 'address': ...}, where address holds only
+# the fields written to the addresses table (no street lines). It lives in a
+# user-private file and is opened by main(); shared across worker threads.
+ETAG_CACHE_DIR = Path(os.getenv('XDG_CACHE_HOME') or Path.home() / '.cache') / 'workwize'
+ETAG_CACHE_PATH = ETAG_CACHE_DIR / 'employee_address_etags'
+etag_cache_lock = threading.Lock()
+
+# Rows per INSERT batch; batches are written while address lookups continue
+WRITE_BATCH_SIZE = 1000
+
+ADDRESS_INSERT_QUERY = """
+    INSERT INTO addresses (id, country, city, "postalCode", "createdAt", "updatedAt")
+    VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        country = EXCLUDED.country,
+        city = EXCLUDED.city,
+        "postalCode" = EXCLUDED."postalCode",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
+
+EMPLOYEE_INSERT_QUERY = """
+    INSERT INTO employees (
+        id, "firstName", "lastName", email, department, role,
+        status, "jobTitle", "managerId", "officeId", "addressId",
+        "startDate", "endDate", team, "foreignId",
+        "registrationStatus", "isDeactivated", "userId",
+        "createdAt", "updatedAt"
+    ) VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        "firstName" = EXCLUDED."firstName",
+        "lastName" = EXCLUDED."lastName",
+        email = EXCLUDED.email,
+        department = EXCLUDED.department,
+        role = EXCLUDED.role,
+        status = EXCLUDED.status,
+        "jobTitle" = EXCLUDED."jobTitle",
+        "managerId" = EXCLUDED."managerId",
+        "officeId" = EXCLUDED."officeId",
+        "addressId" = EXCLUDED."addressId",
+        "startDate" = EXCLUDED."startDate",
+        "endDate" = EXCLUDED."endDate",
+        team = EXCLUDED.team,
+        "foreignId" = EXCLUDED."foreignId",
+        "registrationStatus" = EXCLUDED."registrationStatus",
+        "isDeactivated" = EXCLUDED."isDeactivated",
+        "userId" = EXCLUDED."userId",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
+
 # PII Scrubbing Functions
 def redact_name(name):
     """Redact name to first letter + asterisks."""
@@ -53,36 +124,67 @@ def anonymize_email(email):
     return f"{local[0]}***@{domain}"
 
 
-def fetch_employee_address(employee_id):
+def open_etag_cache():
+    """Open the address ETag cache, or return None if it can't be opened (e.g. it's in use)."""
+    try:
+        ETAG_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        return shelve.Shelf(dbm.open(str(ETAG_CACHE_PATH), 'c', 0o600))
+    except (OSError, dbm.error) as e:
+        print(f"⚠️  Address ETag cache unavailable, fetching every address: {e}")
+        return None
+
+
+def prune_etag_cache(etag_cache, seen_keys):
+    """Drop cache entries for employees that weren't looked up in this run."""
+    for key in set(etag_cache.keys()) - seen_keys:
+        del etag_cache[key]
+
+
+def fetch_employee_address(employee_id, etag_cache=None):
     """Fetch address data for a specific employee including country information."""
     url = f'{WORKWIZE_BASE_URL}/employees/{employee_id}/addresses'
-    headers = {
-        'Authorization': f'Bearer {WORKWIZE_KEY}',
-        'Accept': 'application/json'
-    }
+    headers = {}
+    
+    cache_key = str(employee_id)
+    cached = None
+    if etag_cache is not None:
+        with etag_cache_lock:
+            cached = etag_cache.get(cache_key)
+    if cached:
+        headers['If-None-Match'] = cached['etag']
     
     try:
-        response = requests.get(url, headers=headers, verify=False, timeout=10)
+        response = SESSION.get(url, headers=headers, verify=False, timeout=10)
         
         # If 404, employee has no address
         if response.status_code == 404:
             return None
         
+        if response.status_code == 304 and cached:
+            # Unchanged since last run - reuse the cached address
+            return cached['address']
+        
         response.raise_for_status()
         data = response.json()
         
         # Extract full address data including country
+        address = None
         if isinstance(data, dict) and data.get('data'):
             address_data = data['data']
             if address_data and address_data.get('id'):
-                return {
+                address = {
                     'id': str(address_data['id']),
                     'country': address_data.get('country', {}).get('name') if address_data.get('country') else None,
                     'city': address_data.get('city'),
                     'postalCode': address_data.get('postal_code') or address_data.get('postcode')
                 }
         
-        return None
+        etag = response.headers.get('ETag')
+        if etag and etag_cache is not None:
+            with etag_cache_lock:
+                etag_cache[cache_key] = {'etag': etag, 'address': address}
+        
+        return address
     except requests.exceptions.Timeout:
         return None
     except requests.exceptions.RequestException as e:
@@ -94,21 +196,16 @@ def fetch_employee_address(employee_id):
         time.sleep(0.01)
 
 
-def fetch_employees():
-    """Fetch all employees from Workwize API with pagination."""
-    all_employees = []
+def iter_employee_pages():
+    """Yield employees from the Workwize API one page at a time."""
     page = 1
-    
-    headers = {
-        'Authorization': f'Bearer {WORKWIZE_KEY}',
-        'Accept': 'application/json'
-    }
+    fetched = 0
     
     while True:
         url = f'{WORKWIZE_BASE_URL}/employees?page={page}'
         print(f"Fetching page {page} from {url}...")
         
-        response = requests.get(url, headers=headers, verify=False)
+        response = SESSION.get(url, verify=False)
         response.raise_for_status()
         
         data = response.json()
@@ -122,8 +219,7 @@ def fetch_employees():
             else:
                 employees = [data]
             
-            # Add to collection
-            all_employees.extend(employees)
+            fetched += len(employees)
             
             # Check pagination info
             meta = data.get('meta', {})
@@ -133,7 +229,9 @@ def fetch_employees():
             last_page = meta.get('last_page')
             total = meta.get('total', 0)
             
-            print(f"  Page {current_page}: Fetched {len(employees)} employees (Total so far: {len(all_employees)}/{total})")
+            print(f"  Page {current_page}: Fetched {len(employees)} employees (Total so far: {fetched}/{total})")
+            
+            yield employees
             
             # Check if there's a next page
             if not links.get('next') or (last_page and current_page >= last_page):
@@ -142,71 +240,133 @@ def fetch_employees():
             page += 1
         else:
             # If it's just an array, no pagination
-            all_employees = data
+            yield data
             break
+
+
+def fetch_employees():
+    """Fetch all employees from Workwize API with pagination."""
+    all_employees = []
+    for employees in iter_employee_pages():
+        all_employees.extend(employees)
     
     print(f"\n✅ Fetched {len(all_employees)} total employees")
     return all_employees
 
 
+def _first_value(*keys):
+    """Build an extractor returning the first truthy value among keys."""
+    def extract(employee):
+        get = employee.get
+        value = None
+        for key in keys:
+            value = get(key)
+            if value:
+                return value
+        return value
+    return extract
+
+
+def _parse_date(date_str):
+    """Parse an ISO-8601 date string, returning None if it is missing or invalid."""
+    if not date_str:
+        return None
+    try:
+        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+# Multi-key extractors, built once rather than per row
+_JOB_TITLE = _first_value('job_title', 'jobTitle')
+_MANAGER_ID = _first_value('manager_id', 'managerId')
+_OFFICE_ID = _first_value('office_id', 'officeId')
+_START_DATE = _first_value('start_date', 'startDate', 'created_at')
+_END_DATE = _first_value('end_date', 'endDate')
+_FOREIGN_ID = _first_value('foreign_id', 'foreignId')
+_REGISTRATION_STATUS = _first_value('registrationStatus', 'registration_status')
+_USER_ID = _first_value('user_id', 'userId')
+_CREATED_AT = _first_value('created_at', 'createdAt')
+_UPDATED_AT = _first_value('updated_at', 'updatedAt')
+
+
+def _extract_department(employee):
+    """Department name - extract name from dict, falling back to team."""
+    department = employee.get('department')
+    if department:
+        if isinstance(department, dict):
+            return department.get('name')
+        return str(department)
+    if employee.get('team'):
+        return employee.get('team')
+    return None
+
+
+def _extract_role(employee):
+    """Role - extract from original_role."""
+    role = employee.get('original_role')
+    if not role:
+        return None
+    if isinstance(role, dict):
+        return role.get('display_name') or role.get('name')
+    return str(role)
+
+
+def _extract_manager_id(employee):
+    """Manager ID from either snake_case or camelCase keys."""
+    manager_id = _MANAGER_ID(employee)
+    return str(manager_id) if manager_id else None
+
+
+def _extract_office_id(employee):
+    """Office ID from the nested office object or a flat id field."""
+    office = employee.get('office')
+    if office:
+        if isinstance(office, dict):
+            off_id = office.get('id')
+            return str(off_id) if off_id else None
+        return str(office)
+    office_id = _OFFICE_ID(employee)
+    return str(office_id) if office_id else None
+
+
+# Column extractors in database column order. address_id, created_at and
+# updated_at are filled in by transform_employee since they need extra inputs.
+_EMPLOYEE_FIELDS = (
+    ('id', lambda e: str(e.get('id', ''))),
+    ('first_name', lambda e: redact_name(e.get('first_name') or e.get('firstName') or '')),
+    ('last_name', lambda e: redact_name(e.get('last_name') or e.get('lastName') or '')),
+    ('email', lambda e: anonymize_email(e.get('email') or '')),
+    ('department', _extract_department),
+    ('role', _extract_role),
+    ('status', lambda e: 'inactive' if e.get('isDeactivated') else 'active'),
+    ('job_title', _JOB_TITLE),
+    ('manager_id', _extract_manager_id),
+    ('office_id', _extract_office_id),
+    ('start_date', lambda e: _parse_date(_START_DATE(e))),
+    ('end_date', lambda e: _parse_date(_END_DATE(e))),
+    ('team', lambda e: e.get('team')),
+    ('foreign_id', _FOREIGN_ID),
+    ('registration_status', _REGISTRATION_STATUS),
+    ('is_deactivated', lambda e: e.get('isDeactivated', False) or e.get('is_deactivated', False)),
+    ('user_id', _USER_ID),
+    ('created_at', lambda e: _parse_date(_CREATED_AT(e))),
+    ('updated_at', lambda e: _parse_date(_UPDATED_AT(e))),
+)
+
+_EMPLOYEE_COLUMNS = (
+    'id', 'first_name', 'last_name', 'email', 'department', 'role',
+    'status', 'job_title', 'manager_id', 'office_id', 'address_id',
+    'start_date', 'end_date', 'team', 'foreign_id', 'registration_status',
+    'is_deactivated', 'user_id', 'created_at', 'updated_at'
+)
+
+_employee_row = operator.itemgetter(*_EMPLOYEE_COLUMNS)
+
+
 def transform_employee(employee, address_data=None):
     """Transform API employee data to database format with PII scrubbing."""
-    # Extract basic data
-    employee_id = str(employee.get('id', ''))
-    
-    # PII SCRUBBING - Names
-    first_name_raw = employee.get('first_name') or employee.get('firstName') or ''
-    last_name_raw = employee.get('last_name') or employee.get('lastName') or ''
-    email_raw = employee.get('email') or ''
-    
-    first_name = redact_name(first_name_raw)
-    last_name = redact_name(last_name_raw)
-    email = anonymize_email(email_raw)
-    
-    # Department - extract name from dict
-    department = None
-    if employee.get('department'):
-        if isinstance(employee['department'], dict):
-            department = employee['department'].get('name')
-        else:
-            department = str(employee['department'])
-    elif employee.get('team'):
-        department = employee.get('team')
-    
-    # Role - extract from original_role
-    role = None
-    if employee.get('original_role'):
-        if isinstance(employee['original_role'], dict):
-            role = employee['original_role'].get('display_name') or employee['original_role'].get('name')
-        else:
-            role = str(employee['original_role'])
-    
-    # Status - based on isDeactivated flag
-    status = 'inactive' if employee.get('isDeactivated') else 'active'
-    
-    # Job title
-    job_title = employee.get('job_title') or employee.get('jobTitle')
-    
-    # Manager ID
-    manager_id = None
-    if employee.get('manager_id'):
-        manager_id = str(employee['manager_id'])
-    elif employee.get('managerId'):
-        manager_id = str(employee['managerId'])
-    
-    # Office ID
-    office_id = None
-    if employee.get('office'):
-        if isinstance(employee['office'], dict):
-            off_id = employee['office'].get('id')
-            if off_id:
-                office_id = str(off_id)
-        else:
-            office_id = str(employee['office'])
-    elif employee.get('office_id'):
-        office_id = str(employee['office_id'])
-    elif employee.get('officeId'):
-        office_id = str(employee['officeId'])
+    result = {name: extract(employee) for name, extract in _EMPLOYEE_FIELDS}
     
     # Address ID - extract from address_data dict if provided
     address_id = None
@@ -215,187 +375,146 @@ def transform_employee(employee, address_data=None):
     elif isinstance(address_data, str):
         # Legacy support if string passed
         address_id = address_data
+    result['address_id'] = address_id
     
-    # Start date
-    start_date = None
-    if employee.get('start_date') or employee.get('startDate') or employee.get('created_at'):
-        date_str = employee.get('start_date') or employee.get('startDate') or employee.get('created_at')
-        try:
-            start_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
-    
-    # End date
-    end_date = None
-    if employee.get('end_date') or employee.get('endDate'):
-        date_str = employee.get('end_date') or employee.get('endDate')
-        try:
-            end_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
-    
-    # New fields from API
-    team = employee.get('team')
-    foreign_id = employee.get('foreign_id') or employee.get('foreignId')
-    registration_status = employee.get('registrationStatus') or employee.get('registration_status')
-    is_deactivated = employee.get('isDeactivated', False) or employee.get('is_deactivated', False)
-    user_id = employee.get('user_id') or employee.get('userId')
+    # Timestamps default to now when missing or unparseable
+    if result['created_at'] is None or result['updated_at'] is None:
+        now = datetime.now()
+        result['created_at'] = result['created_at'] or now
+        result['updated_at'] = result['updated_at'] or now
     
-    # Timestamps
-    created_at = datetime.now()
-    if employee.get('created_at') or employee.get('createdAt'):
-        date_str = employee.get('created_at') or employee.get('createdAt')
-        try:
-            created_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
-    
-    updated_at = datetime.now()
-    if employee.get('updated_at') or employee.get('updatedAt'):
-        date_str = employee.get('updated_at') or employee.get('updatedAt')
-        try:
-            updated_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
-    
-    return (
-        employee_id,
-        first_name,
-        last_name,
-        email,
-        department,
-        role,
-        status,
-        job_title,
-        manager_id,
-        office_id,
-        address_id,
-        start_date,
-        end_date,
-        team,
-        foreign_id,
-        registration_status,
-        is_deactivated,
-        user_id,
-        created_at,
-        updated_at
-    )
-
-
-def fetch_employee_with_address(employee):
+    return _employee_row(result)
+
+
+def fetch_employee_with_address(employee, etag_cache=None):
     """Fetch address for a single employee and return both employee and address data."""
     employee_id = employee.get('id')
     address_data = None
     
     if employee_id:
-        address_data = fetch_employee_address(employee_id)
+        address_data = fetch_employee_address(employee_id, etag_cache)
     
     # Return tuple of (employee_tuple, address_data)
     return (transform_employee(employee, address_data), address_data)
 
 
-def populate_employees(employees):
-    """Insert employees into PostgreSQL database."""
+def iter_address_lookups(executor, employees, etag_cache=None):
+    """
+    Yield (employee, future) pairs as address lookups finish.
+    
+    Employees are submitted as they're read, with at most ADDRESS_WINDOW
+    lookups outstanding, so results can be written while later pages are
+    still being fetched.
+    """
+    pending = {}
+    for employee in employees:
+        pending[executor.submit(fetch_employee_with_address, employee, etag_cache)] = employee
+        if len(pending) < ADDRESS_WINDOW:
+            continue
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+    
+    for future in as_completed(pending):
+        yield pending[future], future
+
+
+def write_employee_batch(cursor, results):
+    """Upsert one batch of (employee_tuple, address_data) results. Returns the address count."""
+    now = datetime.now()
+    addresses = [
+        (
+            address_data['id'],
+            address_data.get('country'),
+            address_data.get('city'),
+            address_data.get('postalCode'),
+            now,
+            now
+        )
+        for _, address_data in results
+        if address_data and isinstance(address_data, dict)
+    ]
+    
+    # Addresses first so the employees' addressId foreign keys resolve
+    if addresses:
+        execute_values(cursor, ADDRESS_INSERT_QUERY, addresses, page_size=WRITE_BATCH_SIZE)
+    
+    employee_data = [emp_tuple for emp_tuple, _ in results]
+    execute_values(cursor, EMPLOYEE_INSERT_QUERY, employee_data, page_size=WRITE_BATCH_SIZE)
+    
+    return len(addresses)
+
+
+def populate_employees(employees, etag_cache=None):
+    """Insert employees into PostgreSQL database.
+    
+    `employees` may be any iterable (e.g. a generator over API pages). Address
+    lookups start as employees arrive, and completed results are written in
+    batches of WRITE_BATCH_SIZE while the remaining lookups are still in
+    flight. Everything is committed once at the end, so a failed run leaves
+    the tables as they were. etag_cache, if given, enables conditional address
+    GETs and is pruned to the employees seen once the load succeeds. Returns
+    the number of employees written.
+    """
     conn = psycopg2.connect(DATABASE_URL)
     cursor = conn.cursor()
     
     try:
-        # Transform all employees with address data using parallel processing
-        results = []
         print("\nFetching address data for employees (parallel processing)...")
         
-        # Use ThreadPoolExecutor for concurrent API calls
-        max_workers = 10  # Concurrent requests
-        batch_size = 100  # Progress update frequency
+        progress_every = 100  # Progress update frequency
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            future_to_employee = {executor.submit(fetch_employee_with_address, emp): emp for emp in employees}
-            
-            completed = 0
-            for future in as_completed(future_to_employee):
-                try:
-                    result = future.result()  # Returns (employee_tuple, address_data)
-                    results.append(result)
-                    completed += 1
+        batch = []
+        written = 0
+        addresses_written = 0
+        completed = 0
+        seen_keys = set()
+        
+        with ThreadPoolExecutor(max_workers=ADDRESS_WORKERS) as executor:
+            try:
+                for emp, future in iter_address_lookups(executor, employees, etag_cache):
+                    if emp.get('id'):
+                        seen_keys.add(str(emp['id']))
+                    
+                    try:
+                        result = future.result()  # Returns (employee_tuple, address_data)
+                    except Exception as e:
+                        print(f"  ⚠️  Error processing employee {emp.get('id')}: {e}")
+                        # Add employee without address on error
+                        result = (transform_employee(emp, None), None)
                     
-                    if completed % batch_size == 0 or completed == len(employees):
-                        print(f"  Progress: {completed}/{len(employees)} ({completed*100//len(employees)}%)")
-                except Exception as e:
-                    emp = future_to_employee[future]
-                    print(f"  ⚠️  Error processing employee {emp.get('id')}: {e}")
-                    # Add employee without address on error
-                    results.append((transform_employee(emp, None), None))
+                    batch.append(result)
                     completed += 1
+                    
+                    if completed % progress_every == 0:
+                        print(f"  Progress: {completed} employees processed")
+                    
+                    # Write full batches while the remaining lookups are still running
+                    if len(batch) >= WRITE_BATCH_SIZE:
+                        addresses_written += write_employee_batch(cursor, batch)
+                        written += len(batch)
+                        batch = []
+            except BaseException:
+                # Drop the queued lookups rather than waiting on them before the error surfaces
+                executor.shutdown(cancel_futures=True)
+                raise
         
-        print(f"\n✅ Fetched address data for {len(results)} employees")
-        
-        # First, create all address records
-        addresses_to_create = []
-        for emp_tuple, address_data in results:
-            if address_data and isinstance(address_data, dict):
-                addresses_to_create.append((
-                    address_data['id'],
-                    address_data.get('country'),
-                    address_data.get('city'),
-                    address_data.get('postalCode'),
-                    datetime.now(),
-                    datetime.now()
-                ))
-        
-        if addresses_to_create:
-            print(f"\nCreating {len(addresses_to_create)} employee address records...")
-            address_insert_query = """
-                INSERT INTO addresses (id, country, city, "postalCode", "createdAt", "updatedAt")
-                VALUES %s
-                ON CONFLICT (id) DO UPDATE SET
-                    country = EXCLUDED.country,
-                    city = EXCLUDED.city,
-                    "postalCode" = EXCLUDED."postalCode",
-                    "updatedAt" = EXCLUDED."updatedAt"
-            """
-            execute_values(cursor, address_insert_query, addresses_to_create)
-            conn.commit()
-            print(f"✅ Created/updated {len(addresses_to_create)} address records")
+        if not completed:
+            return 0
         
-        # Extract employee tuples for insertion
-        employee_data = [emp_tuple for emp_tuple, _ in results]
+        if batch:
+            addresses_written += write_employee_batch(cursor, batch)
+            written += len(batch)
         
-        # Insert query with ON CONFLICT to handle duplicates
-        insert_query = """
-            INSERT INTO employees (
-                id, "firstName", "lastName", email, department, role,
-                status, "jobTitle", "managerId", "officeId", "addressId",
-                "startDate", "endDate", team, "foreignId",
-                "registrationStatus", "isDeactivated", "userId",
-                "createdAt", "updatedAt"
-            ) VALUES %s
-            ON CONFLICT (id) DO UPDATE SET
-                "firstName" = EXCLUDED."firstName",
-                "lastName" = EXCLUDED."lastName",
-                email = EXCLUDED.email,
-                department = EXCLUDED.department,
-                role = EXCLUDED.role,
-                status = EXCLUDED.status,
-                "jobTitle" = EXCLUDED."jobTitle",
-                "managerId" = EXCLUDED."managerId",
-                "officeId" = EXCLUDED."officeId",
-                "addressId" = EXCLUDED."addressId",
-                "startDate" = EXCLUDED."startDate",
-                "endDate" = EXCLUDED."endDate",
-                team = EXCLUDED.team,
-                "foreignId" = EXCLUDED."foreignId",
-                "registrationStatus" = EXCLUDED."registrationStatus",
-                "isDeactivated" = EXCLUDED."isDeactivated",
-                "userId" = EXCLUDED."userId",
-                "updatedAt" = EXCLUDED."updatedAt"
-        """
+        conn.commit()
+        print(f"  Progress: {completed} employees processed")
         
-        # Execute batch insert with employee data
-        execute_values(cursor, insert_query, employee_data)
+        if etag_cache is not None:
+            with etag_cache_lock:
+                prune_etag_cache(etag_cache, seen_keys)
         
-        conn.commit()
-        print(f"✅ Successfully inserted/updated {len(employee_data)} employees")
+        print(f"\n✅ Created/updated {addresses_written} address records")
+        print(f"✅ Successfully inserted/updated {written} employees")
         
         # Show summary
         cursor.execute("SELECT COUNT(*) FROM employees")
@@ -414,6 +533,8 @@ def populate_employees(employees):
         for dept, count in dept_counts:
             print(f"  {dept}: {count}")
         
+        return written
+        
     except Exception as e:
         conn.rollback()
         print(f"❌ Error inserting employees: {e}")
@@ -438,17 +559,15 @@ def main():
         print("❌ Error: DATABASE_URL not found in environment variables")
         sys.exit(1)
     
+    etag_cache = open_etag_cache()
     try:
-        # Fetch employees from API
-        employees = fetch_employees()
+        # Stream employees from the API straight into the address/DB pipeline
+        employees = (employee for page in iter_employee_pages() for employee in page)
         
-        if not employees:
+        if not populate_employees(employees, etag_cache):
             print("⚠️  No employees found in API response")
             return
         
-        # Populate database
-        populate_employees(employees)
-        
         print("\n✅ Employee population complete!")
         print("\n⚠️  REMINDER: All PII has been scrubbed:")
         print("  - Names: Redacted to first letter + ***")
@@ -463,6 +582,9 @@ def main():
     except Exception as e:
         print(f"❌ Unexpected Error: {e}")
         sys.exit(1)
+    finally:
+        if etag_cache is not None:
+            etag_cache.close()
 
 
 if __name__ == '__main__':
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
 import os
+import dbm
+import shelve
+import threading
 import psycopg2
 import requests
 from datetime import datetime
+from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 from dotenv import load_dotenv
@@ -25,7 +29,32 @@ if not WORKWIZE_API_KEY:
 
 WORKWIZE_BASE_URL = 'https://prod-back.goworkwize.com/api/public/employees'
 
-def fetch_employee_address(employee_id):
+# Rows per round trip when streaming employee IDs from the database
+EMPLOYEE_ID_FETCH_SIZE = 10000
+
+# ETag cache for the addresses endpoint so reruns can use conditional GETs.
+# Maps employee ID -> {'etag': ..., 'address': ...}, where address holds only
+# the fields written to the addresses table. It lives in a user-private file
+# and is opened by populate_missing_addresses().
+ETAG_CACHE_DIR = Path(os.getenv('XDG_CACHE_HOME') or Path.home() / '.cache') / 'workwize'
+ETAG_CACHE_PATH = ETAG_CACHE_DIR / 'missing_address_etags'
+etag_cache_lock = threading.Lock()
+
+def open_etag_cache():
+    """Open the address ETag cache, or return None if it can't be opened (e.g. it's in use)"""
+    try:
+        ETAG_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        return shelve.Shelf(dbm.open(str(ETAG_CACHE_PATH), 'c', 0o600))
+    except (OSError, dbm.error) as e:
+        print(f"Address ETag cache unavailable, fetching every address: {e}")
+        return None
+
+def prune_etag_cache(etag_cache, seen_keys):
+    """Drop cache entries for employees that weren't looked up in this run"""
+    for key in set(etag_cache.keys()) - seen_keys:
+        del etag_cache[key]
+
+def fetch_employee_address(employee_id, etag_cache=None):
     """Fetch address for a specific employee from Workwize API"""
     url = f'{WORKWIZE_BASE_URL}/{employee_id}/addresses'
     headers = {
@@ -33,42 +62,52 @@ def fetch_employee_address(employee_id):
         'Content-Type': 'application/json'
     }
     
+    cache_key = str(employee_id)
+    cached = None
+    if etag_cache is not None:
+        with etag_cache_lock:
+            cached = etag_cache.get(cache_key)
+    if cached:
+        headers['If-None-Match'] = cached['etag']
+    
     try:
         response = requests.get(url, headers=headers, verify=False, timeout=10)
         time.sleep(0.01)  # 10ms rate limiting
+
+        if response.status_code == 304 and cached:
+            # Unchanged since last run - reuse the cached address
+            return cached['address']
+        if response.status_code != 200:
+            return None
         
-        # Debug first 3 employees
-        if employee_id in ['117576', '952782', '118662']:
-            print(f"\nDEBUG employee {employee_id}:")
-            print(f"  Status: {response.status_code}")
-            if response.status_code == 200:
-                data = response.json()
-                print(f"  Success: {data.get('success')}")
-                print(f"  Has data: {bool(data.get('data'))}")
-                if data.get('data'):
-                    print(f"  Data keys: {list(data['data'].keys())}")
+        data = response.json()
+        address = None
+        if data and data.get('success') and data.get('data'):
+            address_data = data['data']
+            
+            # Extract country name - can be nested or direct
+            country_name = None
+            country_data = address_data.get('country')
+            if isinstance(country_data, dict):
+                country_name = country_data.get('name')
+            elif isinstance(country_data, str):
+                country_name = country_data
+            
+            if country_name:
+                address = {
+                    'id': str(address_data.get('id')),
+                    'city': address_data.get('city'),
+                    'region': address_data.get('region'),
+                    'postalCode': address_data.get('postal_code') or address_data.get('postcode'),
+                    'country': country_name
+                }
         
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success') and data.get('data'):
-                address_data = data['data']
-                
-                # Extract country name - can be nested or direct
-                country_name = None
-                country_data = address_data.get('country')
-                if isinstance(country_data, dict):
-                    country_name = country_data.get('name')
-                elif isinstance(country_data, str):
-                    country_name = country_data
-                
-                if country_name:
-                    return {
-                        'id': str(address_data.get('id')),
-                        'city': address_data.get('city'),
-                        'region': address_data.get('region'),
-                        'postalCode': address_data.get('postal_code') or address_data.get('postcode'),
-                        'country': country_name
-                    }
+        etag = response.headers.get('ETag')
+        if etag and etag_cache is not None:
+            with etag_cache_lock:
+                etag_cache[cache_key] = {'etag': etag, 'address': address}
+        
+        return address
     except Exception as e:
         print(f"Error fetching address for employee {employee_id}: {e}")
     
@@ -77,11 +116,15 @@ def fetch_employee_address(employee_id):
 def get_employees_without_addresses():
     """Get all employees that don't have an addressId"""
     conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
+    # Server-side cursor so the IDs stream in batches instead of being
+    # buffered client-side all at once
+    cur = conn.cursor(name='employees_without_addresses')
+    cur.itersize = EMPLOYEE_ID_FETCH_SIZE
     
     cur.execute('SELECT id FROM employees WHERE "addressId" IS NULL ORDER BY id')
-    employee_ids = [row[0] for row in cur.fetchall()]
+    employee_ids = [row[0] for row in cur]
     
+    cur.close()
     conn.close()
     return employee_ids
 
@@ -101,22 +144,30 @@ def populate_missing_addresses():
     addresses_to_create = {}
     employee_address_map = {}
     
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_emp = {executor.submit(fetch_employee_address, emp_id): emp_id for emp_id in employee_ids}
-        
-        completed = 0
-        for future in as_completed(future_to_emp):
-            emp_id = future_to_emp[future]
-            completed += 1
+    etag_cache = open_etag_cache()
+    try:
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            future_to_emp = {executor.submit(fetch_employee_address, emp_id, etag_cache): emp_id for emp_id in employee_ids}
             
-            if completed % 10 == 0:
-                print(f"  Processed {completed}/{len(employee_ids)} employees")
+            completed = 0
+            for future in as_completed(future_to_emp):
+                emp_id = future_to_emp[future]
+                completed += 1
+                
+                if completed % 10 == 0:
+                    print(f"  Processed {completed}/{len(employee_ids)} employees")
+                
+                address = future.result()
+                if address:
+                    address_id = address['id']
+                    addresses_to_create[address_id] = address
+                    employee_address_map[emp_id] = address_id
             
-            address = future.result()
-            if address:
-                address_id = address['id']
-                addresses_to_create[address_id] = address
-                employee_address_map[emp_id] = address_id
+        if etag_cache is not None:
+            prune_etag_cache(etag_cache, {str(emp_id) for emp_id in employee_ids})
+    finally:
+        if etag_cache is not None:
+            etag_cache.close()
     
     print(f"\nFound addresses for {len(employee_address_map)} employees")
     
@@ -10,13 +10,25 @@ Usage:
 
 import os
 import sys
+import csv
+import io
 import requests
+from requests.adapters import HTTPAdapter
 import psycopg2
-from psycopg2.extras import execute_values
 from datetime import datetime
+from functools import lru_cache
 from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import re
 import urllib3
+from urllib3.util.retry import Retry
+
+# orjson is optional; it decodes the large API pages several times faster than json
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # Suppress InsecureRequestWarning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -29,81 +41,213 @@ WORKWIZE_KEY = os.getenv('WORKWIZE_KEY')
 DATABASE_URL = os.getenv('DATABASE_URL')
 WORKWIZE_BASE_URL = 'https://prod-back.goworkwize.com/api/public'
 
+# NULL marker for COPY (CSV format). COPY reads any unquoted \N as NULL and
+# csv.writer doesn't quote it, so a string value of exactly \N also loads as NULL.
+COPY_NULL = r'\N'
+
+# Rows sent per COPY round trip while streaming into staging
+COPY_BATCH_SIZE = 1000
+
+# Concurrent page requests once the page count is known
+PAGE_FETCH_WORKERS = 16
+
+# Pages fetched ahead of the rows being copied into the database
+PAGE_PREFETCH = 2 * PAGE_FETCH_WORKERS
+
+# Shared HTTP session so pages reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({
+    'Authorization': f'Bearer {WORKWIZE_KEY}',
+    'Accept': 'application/json'
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=PAGE_FETCH_WORKERS,
+    pool_maxsize=PAGE_FETCH_WORKERS,
+    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+
+# PII patterns, compiled once at import
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+_PHONE_RE = re.compile(r'[\+\(]?[1-9][0-9 .\-\(\)]{8,}[0-9]')
+_ADDRESS_RE = re.compile(r'\d+\s+[\w\s]+(?:Street|St|Avenue|Ave|Road|Rd|Drive|Dr|Lane|Ln|Boulevard|Blvd|Way|Court|Ct|Circle|Cir)\b', re.IGNORECASE)
+
+# Cheap pre-checks so the regexes only run on text that could match
+_ASCII_DIGITS = str.maketrans('', '', '0123456789')
+_STREET_KEYWORDS = (
+    'street', 'st', 'avenue', 'ave', 'road', 'rd', 'drive', 'dr', 'lane', 'ln',
+    'boulevard', 'blvd', 'way', 'court', 'ct', 'circle', 'cir'
+)
+# IGNORECASE also matches dotless/dotted I against 'i', which casefold() doesn't
+_KEYWORD_FOLD = str.maketrans({'ı': 'i', 'İ': 'i'})
+
+
+def _has_digit(text):
+    """Check for a decimal digit, matching what \\d matches in the patterns."""
+    if len(text.translate(_ASCII_DIGITS)) != len(text):
+        return True
+    # \d also matches non-ASCII decimal digits
+    return not text.isascii() and any(c.isdecimal() for c in text)
+
 
 def scrub_pii_text(text):
     """Scrub PII from text fields (emails, phone numbers, addresses)."""
     if not text:
         return None
     
-    # Remove email addresses
-    text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[EMAIL_REDACTED]', text)
+    # Only run the passes that can match: emails need an '@', phone numbers
+    # and street addresses need a digit
+    has_email = '@' in text
+    has_digit = _has_digit(text)
     
-    # Remove phone numbers (various formats)
-    text = re.sub(r'[\+\(]?[1-9][0-9 .\-\(\)]{8,}[0-9]', '[PHONE_REDACTED]', text)
+    # Remove email addresses
+    if has_email:
+        text = _EMAIL_RE.sub('[EMAIL_REDACTED]', text)
     
-    # Remove street addresses (lines with numbers and street keywords)
-    text = re.sub(r'\d+\s+[\w\s]+(?:Street|St|Avenue|Ave|Road|Rd|Drive|Dr|Lane|Ln|Boulevard|Blvd|Way|Court|Ct|Circle|Cir)\b', '[ADDRESS_REDACTED]', text, flags=re.IGNORECASE)
+    if has_digit:
+        # Remove phone numbers (various formats)
+        text = _PHONE_RE.sub('[PHONE_REDACTED]', text)
+        
+        # Remove street addresses (lines with numbers and street keywords)
+        folded = text.translate(_KEYWORD_FOLD).casefold()
+        if any(keyword in folded for keyword in _STREET_KEYWORDS):
+            text = _ADDRESS_RE.sub('[ADDRESS_REDACTED]', text)
     
     return text.strip()
 
 
-def fetch_offboards():
-    """Fetch all offboards from Workwize API with pagination."""
-    all_offboards = []
-    page = 1
+def fetch_offboards_page(page):
+    """Fetch a single page of offboards from the Workwize API."""
+    url = f'{WORKWIZE_BASE_URL}/offboards?page={page}'
+    print(f"Fetching page {page} from {url}...")
     
-    headers = {
-        'Authorization': f'Bearer {WORKWIZE_KEY}',
-        'Accept': 'application/json'
-    }
+    response = SESSION.get(url, verify=False, timeout=30)
+    response.raise_for_status()
     
-    while True:
-        url = f'{WORKWIZE_BASE_URL}/offboards?page={page}'
-        print(f"Fetching page {page} from {url}...")
-        
-        response = requests.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        
-        data = response.json()
+    return json_loads(response.content)
+
+
+def has_next_page(data, page):
+    """Check a page response's pagination info for a following page."""
+    meta = data.get('meta', {})
+    links = data.get('links', {})
+    
+    current_page = meta.get('current_page', page)
+    last_page = meta.get('last_page')
+    
+    return bool(links.get('next')) and not (last_page and current_page >= last_page)
+
+
+def iter_offboards_pages():
+    """
+    Yield each page response from the Workwize API, in page order.
+    
+    Page 1 is fetched first to learn meta.last_page, then the remaining pages
+    are fetched concurrently, at most PAGE_PREFETCH ahead of the consumer. If
+    the API doesn't report a page count, pages are followed one at a time.
+    """
+    data = fetch_offboards_page(1)
+    yield data
+    
+    # If it's just an array, no pagination
+    if not isinstance(data, dict) or not has_next_page(data, 1):
+        return
+    
+    last_page = data.get('meta', {}).get('last_page')
+    if last_page:
+        # Page count is known, so fetch the remaining pages concurrently
+        with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+            pending = deque()
+            for page in range(2, last_page + 1):
+                pending.append(executor.submit(fetch_offboards_page, page))
+                if len(pending) >= PAGE_PREFETCH:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    else:
+        page = 1
+        while has_next_page(data, page):
+            page += 1
+            data = fetch_offboards_page(page)
+            yield data
+
+
+def iter_offboards():
+    """Yield all offboards from the Workwize API, page by page as the pages arrive."""
+    fetched = 0
+    for page, data in enumerate(iter_offboards_pages(), 1):
+        if not isinstance(data, dict):
+            fetched += len(data)
+            yield from data
+            continue
         
         # Handle different response formats
-        if isinstance(data, dict):
-            if 'data' in data:
-                offboards = data['data']
-            elif 'value' in data:
-                offboards = data['value']
-            else:
-                offboards = [data]
-            
-            # Add to collection
-            all_offboards.extend(offboards)
-            
-            # Check pagination info
-            meta = data.get('meta', {})
-            links = data.get('links', {})
-            
-            current_page = meta.get('current_page', page)
-            last_page = meta.get('last_page')
-            total = meta.get('total', 0)
-            
-            print(f"  Page {current_page}: Fetched {len(offboards)} offboards (Total so far: {len(all_offboards)}/{total})")
-            
-            # Check if there's a next page
-            if not links.get('next') or (last_page and current_page >= last_page):
-                break
-            
-            page += 1
+        if 'data' in data:
+            offboards = data['data']
+        elif 'value' in data:
+            offboards = data['value']
         else:
-            # If it's just an array, no pagination
-            all_offboards = data
-            break
+            offboards = [data]
+        
+        fetched += len(offboards)
+        
+        meta = data.get('meta', {})
+        current_page = meta.get('current_page', page)
+        total = meta.get('total', 0)
+        
+        print(f"  Page {current_page}: Fetched {len(offboards)} offboards (Total so far: {fetched}/{total})")
+        yield from offboards
     
-    print(f"\n✅ Fetched {len(all_offboards)} total offboards")
-    return all_offboards
+    print(f"\n✅ Fetched {fetched} total offboards")
+
+
+def fetch_offboards():
+    """Fetch all offboards from Workwize API with pagination."""
+    return list(iter_offboards())
+
+
+@lru_cache(maxsize=1 << 16)
+def _parse_iso_str(date_str):
+    """Parse an ISO-8601 string; cached because many records share timestamps."""
+    try:
+        return datetime.fromisoformat(date_str[:-1] + '+00:00' if date_str.endswith('Z') else date_str)
+    except ValueError:
+        return None
+
+
+def _parse_iso(date_str):
+    """Parse an ISO-8601 timestamp from the API, returning None if it isn't valid."""
+    if not isinstance(date_str, str):
+        return None
+    return _parse_iso_str(date_str)
+
+
+def _first(obj, keys):
+    """Return the first truthy obj[key] for keys, like chaining obj.get(key) with `or`."""
+    value = None
+    for key in keys:
+        value = obj.get(key)
+        if value:
+            return value
+    return value
+
+
+# Fallback keys for fields the API has returned under different names
+_OFFBOARD_DATE_KEYS = ('offboard_date', 'scheduled_date', 'approved_at')
+_REASON_KEYS = ('reason', 'type')
+_NOTES_KEYS = ('notes', 'extra_info')
+_PROCESSED_BY_KEYS = ('processed_by', 'approved_by')
+_CREATED_AT_KEYS = ('created_at', 'createdAt')
+_UPDATED_AT_KEYS = ('updated_at', 'updatedAt')
+
+# Asset statuses that count as returned
+_RETURNED_STATUSES = frozenset({'returned', 'received', 'available'})
 
 
 def transform_offboard(offboard):
     """Transform API offboard data to database format with PII scrubbing."""
+    now = datetime.now()
+    
     # Extract basic data
     offboard_id = str(offboard.get('id', ''))
     
@@ -114,16 +258,13 @@ def transform_offboard(offboard):
         employee_id = str(emp_id)
     
     # Offboard date
-    offboard_date = datetime.now()
-    date_str = offboard.get('offboard_date') or offboard.get('scheduled_date') or offboard.get('approved_at')
+    offboard_date = now
+    date_str = _first(offboard, _OFFBOARD_DATE_KEYS)
     if date_str:
-        try:
-            offboard_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+        offboard_date = _parse_iso(date_str) or now
     
     # Reason - scrub PII from reason text
-    reason = offboard.get('reason') or offboard.get('type')
+    reason = _first(offboard, _REASON_KEYS)
     if reason:
         reason = scrub_pii_text(reason)
     
@@ -138,42 +279,36 @@ def transform_offboard(offboard):
     
     # Check if assets were returned based on asset status
     assets = offboard.get('assets', [])
-    if assets:
+    if assets and not returned_assets:
         # If all assets have status indicating return, mark as returned
         all_returned = all(
-            asset.get('status') in ['returned', 'received', 'available'] 
+            asset.get('status') in _RETURNED_STATUSES
             for asset in assets if isinstance(asset, dict)
         )
         if all_returned:
             returned_assets = True
     
     # Notes - scrub PII
-    notes = offboard.get('notes') or offboard.get('extra_info')
+    notes = _first(offboard, _NOTES_KEYS)
     if notes:
         notes = scrub_pii_text(notes)
     
     # Processed by
     processed_by = None
-    proc_by = offboard.get('processed_by') or offboard.get('approved_by')
+    proc_by = _first(offboard, _PROCESSED_BY_KEYS)
     if proc_by:
         processed_by = str(proc_by)
     
     # Timestamps
-    created_at = datetime.now()
-    if offboard.get('created_at') or offboard.get('createdAt'):
-        date_str = offboard.get('created_at') or offboard.get('createdAt')
-        try:
-            created_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    created_at = now
+    date_str = _first(offboard, _CREATED_AT_KEYS)
+    if date_str:
+        created_at = _parse_iso(date_str) or now
     
-    updated_at = datetime.now()
-    if offboard.get('updated_at') or offboard.get('updatedAt'):
-        date_str = offboard.get('updated_at') or offboard.get('updatedAt')
-        try:
-            updated_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    updated_at = now
+    date_str = _first(offboard, _UPDATED_AT_KEYS)
+    if date_str:
+        updated_at = _parse_iso(date_str) or now
     
     return (
         offboard_id,
@@ -189,83 +324,159 @@ def transform_offboard(offboard):
     )
 
 
-def populate_offboards(offboards):
-    """Insert offboards into PostgreSQL database."""
-    conn = psycopg2.connect(DATABASE_URL)
+# COPY staging table, in the same column order as the upsert. Timestamps are
+# timestamptz so API offsets are converted into the timestamp columns the same
+# way the parameterised INSERT converted them. seq records arrival order so the
+# upsert keeps the last row for an id that shows up on more than one page, as
+# the row-by-row upserts did.
+OFFBOARDS_STAGING_SQL = """
+    CREATE TEMP TABLE staging_offboards (
+        id text,
+        "employeeId" text,
+        "offboardDate" timestamptz,
+        reason text,
+        status text,
+        "returnedAssets" boolean,
+        notes text,
+        "processedBy" text,
+        "createdAt" timestamptz,
+        "updatedAt" timestamptz,
+        seq bigserial
+    ) ON COMMIT DROP
+"""
+
+OFFBOARDS_COPY_SQL = r"""
+    COPY staging_offboards (
+        id, "employeeId", "offboardDate", reason, status,
+        "returnedAssets", notes, "processedBy", "createdAt", "updatedAt"
+    ) FROM STDIN WITH (FORMAT csv, NULL '\N')
+"""
+
+OFFBOARDS_UPSERT_SQL = """
+    INSERT INTO offboards (
+        id, "employeeId", "offboardDate", reason, status,
+        "returnedAssets", notes, "processedBy", "createdAt", "updatedAt"
+    )
+    SELECT DISTINCT ON (s.id)
+        id, "employeeId", "offboardDate", reason, status,
+        "returnedAssets", notes, "processedBy", "createdAt", "updatedAt"
+    FROM staging_offboards s
+    WHERE s."employeeId" IS NULL
+       OR EXISTS (SELECT 1 FROM employees e WHERE e.id = s."employeeId")
+    ORDER BY s.id, s.seq DESC
+    ON CONFLICT (id) DO UPDATE SET
+        "employeeId" = EXCLUDED."employeeId",
+        "offboardDate" = EXCLUDED."offboardDate",
+        reason = EXCLUDED.reason,
+        status = EXCLUDED.status,
+        "returnedAssets" = EXCLUDED."returnedAssets",
+        notes = EXCLUDED.notes,
+        "processedBy" = EXCLUDED."processedBy",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
+
+OFFBOARDS_SKIPPED_SQL = """
+    SELECT COUNT(*) FROM staging_offboards s
+    WHERE s."employeeId" IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM employees e WHERE e.id = s."employeeId")
+"""
+
+# Post-load summary: per-status counts with the returned-assets count alongside,
+# in a single scan of offboards
+OFFBOARDS_SUMMARY_SQL = """
+    SELECT status, COUNT(*), COUNT(*) FILTER (WHERE "returnedAssets")
+    FROM offboards
+    GROUP BY status
+    ORDER BY COUNT(*) DESC
+"""
+
+
+def _flush_copy_buffer(cursor, buffer):
+    """Send the buffered CSV rows to the staging table and reset the buffer."""
+    if not buffer.tell():
+        return
+    buffer.seek(0)
+    cursor.copy_expert(OFFBOARDS_COPY_SQL, buffer)
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def copy_to_staging(cursor, rows):
+    """
+    Stream rows into the staging table with COPY FROM STDIN.
+    
+    rows can be any iterable; it is consumed COPY_BATCH_SIZE rows at a time so
+    only one batch of CSV is held in memory. Returns the number of rows copied.
+    """
+    cursor.execute(OFFBOARDS_STAGING_SQL)
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    count = 0
+    for row in rows:
+        writer.writerow([COPY_NULL if value is None else value for value in row])
+        count += 1
+        if count % COPY_BATCH_SIZE == 0:
+            _flush_copy_buffer(cursor, buffer)
+    _flush_copy_buffer(cursor, buffer)
+    
+    return count
+
+
+def populate_offboards(conn, offboards):
+    """
+    Insert offboards into PostgreSQL database using conn.
+    
+    offboards can be any iterable of API records, e.g. iter_offboards() to load pages
+    as they arrive. The caller owns the transaction: nothing is committed here,
+    so several populators can share one connection and commit together.
+    Returns the number of offboards loaded.
+    """
     cursor = conn.cursor()
     
     try:
-        # Get existing employee IDs to validate foreign keys
-        cursor.execute("SELECT id FROM employees")
-        valid_employee_ids = {row[0] for row in cursor.fetchall()}
+        # Transform lazily so rows are streamed straight into COPY
+        offboard_rows = (transform_offboard(offboard) for offboard in offboards)
         
-        # Transform and filter offboards
-        offboard_data = []
-        skipped = 0
-        for offboard in offboards:
-            transformed = transform_offboard(offboard)
-            employee_id = transformed[1]
-            
-            # Skip if employee doesn't exist (could be from deleted accounts)
-            if employee_id and employee_id not in valid_employee_ids:
-                skipped += 1
-                continue
-            
-            offboard_data.append(transformed)
+        # Bulk load into staging with COPY
+        if not copy_to_staging(cursor, offboard_rows):
+            print("⚠️  No offboards found in API response")
+            return 0
         
+        # Offboards for employees that don't exist are skipped by the upsert
+        # (could be from deleted accounts)
+        cursor.execute(OFFBOARDS_SKIPPED_SQL)
+        skipped = cursor.fetchone()[0]
         if skipped > 0:
             print(f"⚠️  Skipped {skipped} offboards with invalid employee references")
         
-        if not offboard_data:
-            print("⚠️  No valid offboards to insert")
-            return
+        # Upsert the offboards with valid employee references in a single statement
+        cursor.execute(OFFBOARDS_UPSERT_SQL)
+        inserted = cursor.rowcount
         
-        # Insert query with ON CONFLICT to handle duplicates
-        insert_query = """
-            INSERT INTO offboards (
-                id, "employeeId", "offboardDate", reason, status,
-                "returnedAssets", notes, "processedBy", "createdAt", "updatedAt"
-            ) VALUES %s
-            ON CONFLICT (id) DO UPDATE SET
-                "employeeId" = EXCLUDED."employeeId",
-                "offboardDate" = EXCLUDED."offboardDate",
-                reason = EXCLUDED.reason,
-                status = EXCLUDED.status,
-                "returnedAssets" = EXCLUDED."returnedAssets",
-                notes = EXCLUDED.notes,
-                "processedBy" = EXCLUDED."processedBy",
-                "updatedAt" = EXCLUDED."updatedAt"
-        """
-        
-        # Execute batch insert
-        execute_values(cursor, insert_query, offboard_data)
+        if not inserted:
+            print("⚠️  No valid offboards to insert")
+            return 0
         
-        conn.commit()
-        print(f"✅ Successfully inserted/updated {len(offboard_data)} offboards")
+        print(f"✅ Successfully inserted/updated {inserted} offboards")
         
         # Show summary
-        cursor.execute("SELECT COUNT(*) FROM offboards")
-        total = cursor.fetchone()[0]
+        cursor.execute(OFFBOARDS_SUMMARY_SQL)
+        summary = cursor.fetchall()
+        total = sum(count for _, count, _ in summary)
         print(f"📊 Total offboards in database: {total}")
         
-        cursor.execute("SELECT status, COUNT(*) FROM offboards GROUP BY status ORDER BY COUNT(*) DESC")
-        status_counts = cursor.fetchall()
-        if status_counts:
+        if summary:
             print("\n📈 Offboards by status:")
-            for status, count in status_counts:
+            for status, count, _ in summary:
                 print(f"  {status or 'Unknown'}: {count}")
         
-        cursor.execute("SELECT COUNT(*) FROM offboards WHERE \"returnedAssets\" = true")
-        returned = cursor.fetchone()[0]
+        returned = sum(count for _, _, count in summary)
         print(f"\n📦 Offboards with returned assets: {returned}")
         
-    except Exception as e:
-        conn.rollback()
-        print(f"❌ Error inserting offboards: {e}")
-        raise
+        return inserted
     finally:
         cursor.close()
-        conn.close()
 
 
 def main():
@@ -284,15 +495,18 @@ def main():
         sys.exit(1)
     
     try:
-        # Fetch offboards from API
-        offboards = fetch_offboards()
-        
-        if not offboards:
-            print("⚠️  No offboards found in API response")
-            return
-        
-        # Populate database
-        populate_offboards(offboards)
+        # Fetch offboards from API and stream them into the database as the
+        # pages arrive, so the COPY overlaps the remaining page fetches
+        conn = psycopg2.connect(DATABASE_URL)
+        try:
+            populate_offboards(conn, iter_offboards())
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error inserting offboards: {e}")
+            raise
+        finally:
+            conn.close()
         
         print("\n✅ Offboard population complete!")
         
@@ -12,13 +12,24 @@ Usage:
 
 import os
 import sys
+import csv
+import io
 import requests
+from requests.adapters import HTTPAdapter
 import psycopg2
-from psycopg2.extras import execute_values
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import urllib3
+from urllib3.util.retry import Retry
+
+# orjson is optional; it decodes the large API pages several times faster than json
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # Suppress InsecureRequestWarning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -32,76 +43,157 @@ WORKWIZE_KEY = os.getenv('WORKWIZE_KEY')
 DATABASE_URL = os.getenv('DATABASE_URL')
 WORKWIZE_BASE_URL = 'https://prod-back.goworkwize.com/api/public'
 
+# NULL marker for COPY (CSV format). COPY reads any unquoted \N as NULL and
+# csv.writer doesn't quote it, so a string value of exactly \N also loads as NULL.
+COPY_NULL = r'\N'
 
-def fetch_offices():
-    """Fetch all offices from Workwize API with pagination."""
-    all_offices = []
-    page = 1
+# Rows sent per COPY round trip while streaming into staging
+COPY_BATCH_SIZE = 1000
+
+# Concurrent page requests once the page count is known
+PAGE_FETCH_WORKERS = 16
+
+# Shared HTTP session so pages reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({
+    'Authorization': f'Bearer {WORKWIZE_KEY}',
+    'Accept': 'application/json'
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=PAGE_FETCH_WORKERS,
+    pool_maxsize=PAGE_FETCH_WORKERS,
+    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+
+def fetch_offices_page(page):
+    """Fetch a single page of offices from the Workwize API. Returns None on 404."""
+    url = f'{WORKWIZE_BASE_URL}/offices?page={page}'
+    print(f"Fetching page {page} from {url}...")
+    
+    response = SESSION.get(url, verify=False, timeout=30)
     
-    headers = {
-        'Authorization': f'Bearer {WORKWIZE_KEY}',
-        'Accept': 'application/json'
-    }
+    # Check if endpoint exists
+    if response.status_code == 404:
+        return None
     
-    while True:
-        url = f'{WORKWIZE_BASE_URL}/offices?page={page}'
-        print(f"Fetching page {page} from {url}...")
+    response.raise_for_status()
+    
+    return json_loads(response.content)
+
+
+def has_next_page(data, page):
+    """Check a page response's pagination info for a following page."""
+    meta = data.get('meta', {})
+    links = data.get('links', {})
+    
+    current_page = meta.get('current_page', page)
+    last_page = meta.get('last_page')
+    
+    return bool(links.get('next')) and not (last_page and current_page >= last_page)
+
+
+def fetch_offices():
+    """Fetch all offices from Workwize API with pagination.
+    
+    Page 1 is fetched first to learn meta.last_page, then the remaining pages
+    are fetched concurrently. If the API doesn't report a page count, pages
+    are followed one at a time instead.
+    """
+    try:
+        data = fetch_offices_page(1)
+        pages = [data]
         
-        try:
-            response = requests.get(url, headers=headers, verify=False)
-            
-            # Check if endpoint exists
-            if response.status_code == 404:
-                print("⚠️  The /offices endpoint returned 404 Not Found")
-                print("   This endpoint may not be available for this account tier")
-                return []
-            
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Handle different response formats
-            if isinstance(data, dict):
-                if 'data' in data:
-                    offices = data['data']
-                elif 'value' in data:
-                    offices = data['value']
-                else:
-                    offices = [data]
-                
-                # Add to collection
-                all_offices.extend(offices)
-                
-                # Check pagination info
-                meta = data.get('meta', {})
-                links = data.get('links', {})
-                
-                current_page = meta.get('current_page', page)
-                last_page = meta.get('last_page')
-                total = meta.get('total', 0)
-                
-                print(f"  Page {current_page}: Fetched {len(offices)} offices (Total so far: {len(all_offices)}/{total})")
-                
-                # Check if there's a next page
-                if not links.get('next') or (last_page and current_page >= last_page):
-                    break
-                
-                page += 1
+        if isinstance(data, dict) and has_next_page(data, 1):
+            last_page = data.get('meta', {}).get('last_page')
+            if last_page:
+                # Page count is known, so fetch the remaining pages concurrently
+                with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+                    pages.extend(executor.map(fetch_offices_page, range(2, last_page + 1)))
             else:
-                # If it's just an array, no pagination
-                all_offices = data
-                break
+                page = 1
+                while data is not None and has_next_page(data, page):
+                    page += 1
+                    data = fetch_offices_page(page)
+                    pages.append(data)
+    
+    except requests.RequestException as e:
+        print(f"❌ Error fetching offices: {e}")
+        return []
+    
+    if None in pages:
+        print("⚠️  The /offices endpoint returned 404 Not Found")
+        print("   This endpoint may not be available for this account tier")
+        return []
+    
+    # If it's just an array, no pagination
+    if not isinstance(pages[0], dict):
+        print(f"\n✅ Fetched {len(pages[0])} total offices")
+        return pages[0]
+    
+    all_offices = []
+    for page, data in enumerate(pages, 1):
+        # Handle different response formats
+        if 'data' in data:
+            offices = data['data']
+        elif 'value' in data:
+            offices = data['value']
+        else:
+            offices = [data]
+        
+        # Add to collection
+        all_offices.extend(offices)
         
-        except requests.RequestException as e:
-            print(f"❌ Error fetching offices: {e}")
-            return []
+        meta = data.get('meta', {})
+        current_page = meta.get('current_page', page)
+        total = meta.get('total', 0)
+        
+        print(f"  Page {current_page}: Fetched {len(offices)} offices (Total so far: {len(all_offices)}/{total})")
     
     print(f"\n✅ Fetched {len(all_offices)} total offices")
     return all_offices
 
 
+@lru_cache(maxsize=1 << 16)
+def _parse_iso_str(date_str):
+    """Parse an ISO-8601 string; cached because many records share timestamps."""
+    try:
+        return datetime.fromisoformat(date_str[:-1] + '+00:00' if date_str.endswith('Z') else date_str)
+    except ValueError:
+        return None
+
+
+def _parse_iso(date_str):
+    """Parse an ISO-8601 timestamp from the API, returning None if it isn't valid."""
+    if not isinstance(date_str, str):
+        return None
+    return _parse_iso_str(date_str)
+
+
+def _first(obj, keys):
+    """Return the first truthy obj[key] for keys, like chaining obj.get(key) with `or`."""
+    value = None
+    for key in keys:
+        value = obj.get(key)
+        if value:
+            return value
+    return value
+
+
+# Fallback keys for fields the API has returned under different names
+_CODE_KEYS = ('code', 'office_code')
+_PHONE_KEYS = ('phone', 'phone_number')
+_EMAIL_KEYS = ('email', 'contact_email')
+_CAPACITY_KEYS = ('capacity', 'max_capacity')
+_EMPLOYER_ID_KEYS = ('employer_id', 'employerId')
+_CREATED_AT_KEYS = ('created_at', 'createdAt')
+_UPDATED_AT_KEYS = ('updated_at', 'updatedAt')
+
+
 def transform_office(office):
     """Transform API office data to database format."""
+    now = datetime.now()
+    
     # Extract basic data
     office_id = str(office.get('id', ''))
     
@@ -109,7 +201,7 @@ def transform_office(office):
     name = office.get('name') or f"Office {office_id}"
     
     # Office code
-    code = office.get('code') or office.get('office_code')
+    code = _first(office, _CODE_KEYS)
     
     # Address ID - may need to look up from addresses table
     # For now, set to None if address doesn't exist in DB
@@ -126,11 +218,11 @@ def transform_office(office):
     #     address_id = str(office['address_id'])
     
     # Contact info
-    phone = office.get('phone') or office.get('phone_number')
-    email = office.get('email') or office.get('contact_email')
+    phone = _first(office, _PHONE_KEYS)
+    email = _first(office, _EMAIL_KEYS)
     
     # Capacity
-    capacity = office.get('capacity') or office.get('max_capacity')
+    capacity = _first(office, _CAPACITY_KEYS)
     if capacity:
         try:
             capacity = int(capacity)
@@ -141,20 +233,16 @@ def transform_office(office):
     status = office.get('status') or 'active'
     
     # Timestamps
-    created_at = datetime.now()
-    if office.get('created_at') or office.get('createdAt'):
-        date_str = office.get('created_at') or office.get('createdAt')
-        try:
-            created_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    created_at = now
+    date_str = _first(office, _CREATED_AT_KEYS)
+    if date_str:
+        created_at = _parse_iso(date_str) or now
     
     # New fields from API
     employer_id = None
-    if office.get('employer_id'):
-        employer_id = str(office['employer_id'])
-    elif office.get('employerId'):
-        employer_id = str(office['employerId'])
+    emp_id = _first(office, _EMPLOYER_ID_KEYS)
+    if emp_id:
+        employer_id = str(emp_id)
     
     manager_id = None
     if office.get('manager'):
@@ -167,13 +255,10 @@ def transform_office(office):
     elif office.get('managerId'):
         manager_id = str(office['managerId'])
     
-    updated_at = datetime.now()
-    if office.get('updated_at') or office.get('updatedAt'):
-        date_str = office.get('updated_at') or office.get('updatedAt')
-        try:
-            updated_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    updated_at = now
+    date_str = _first(office, _UPDATED_AT_KEYS)
+    if date_str:
+        updated_at = _parse_iso(date_str) or now
     
     return (
         office_id,
@@ -191,64 +276,141 @@ def transform_office(office):
     )
 
 
-def populate_offices(offices):
-    """Insert offices into PostgreSQL database."""
-    conn = psycopg2.connect(DATABASE_URL)
+# COPY staging table, in the same column order as the upsert. Timestamps are
+# timestamptz so API offsets are converted into the timestamp columns the same
+# way the parameterised INSERT converted them. seq records arrival order so the
+# upsert keeps the last row for an id that shows up on more than one page, as
+# the row-by-row upserts did.
+OFFICES_STAGING_SQL = """
+    CREATE TEMP TABLE staging_offices (
+        id text,
+        name text,
+        code text,
+        "addressId" text,
+        phone text,
+        email text,
+        capacity integer,
+        status text,
+        "employerId" text,
+        "managerId" text,
+        "createdAt" timestamptz,
+        "updatedAt" timestamptz,
+        seq bigserial
+    ) ON COMMIT DROP
+"""
+
+OFFICES_COPY_SQL = r"""
+    COPY staging_offices (
+        id, name, code, "addressId", phone, email,
+        capacity, status, "employerId", "managerId",
+        "createdAt", "updatedAt"
+    ) FROM STDIN WITH (FORMAT csv, NULL '\N')
+"""
+
+OFFICES_UPSERT_SQL = """
+    INSERT INTO offices (
+        id, name, code, "addressId", phone, email,
+        capacity, status, "employerId", "managerId",
+        "createdAt", "updatedAt"
+    )
+    SELECT DISTINCT ON (id)
+        id, name, code, "addressId", phone, email,
+        capacity, status, "employerId", "managerId",
+        "createdAt", "updatedAt"
+    FROM staging_offices
+    ORDER BY id, seq DESC
+    ON CONFLICT (id) DO UPDATE SET
+        name = EXCLUDED.name,
+        code = EXCLUDED.code,
+        "addressId" = EXCLUDED."addressId",
+        phone = EXCLUDED.phone,
+        email = EXCLUDED.email,
+        capacity = EXCLUDED.capacity,
+        status = EXCLUDED.status,
+        "employerId" = EXCLUDED."employerId",
+        "managerId" = EXCLUDED."managerId",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
+
+# Post-load summary: per-status counts with the with-address count alongside,
+# in a single scan of offices
+OFFICES_SUMMARY_SQL = """
+    SELECT status, COUNT(*), COUNT(*) FILTER (WHERE "addressId" IS NOT NULL)
+    FROM offices
+    GROUP BY status
+    ORDER BY COUNT(*) DESC
+"""
+
+
+def _flush_copy_buffer(cursor, buffer):
+    """Send the buffered CSV rows to the staging table and reset the buffer."""
+    if not buffer.tell():
+        return
+    buffer.seek(0)
+    cursor.copy_expert(OFFICES_COPY_SQL, buffer)
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def copy_to_staging(cursor, rows):
+    """
+    Stream rows into the staging table with COPY FROM STDIN.
+    
+    rows can be any iterable; it is consumed COPY_BATCH_SIZE rows at a time so
+    only one batch of CSV is held in memory. Returns the number of rows copied.
+    """
+    cursor.execute(OFFICES_STAGING_SQL)
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    count = 0
+    for row in rows:
+        writer.writerow([COPY_NULL if value is None else value for value in row])
+        count += 1
+        if count % COPY_BATCH_SIZE == 0:
+            _flush_copy_buffer(cursor, buffer)
+    _flush_copy_buffer(cursor, buffer)
+    
+    return count
+
+
+def populate_offices(conn, offices):
+    """
+    Insert offices into PostgreSQL database using conn.
+    
+    The caller owns the transaction: nothing is committed here, so several
+    populators can share one connection and commit together. Returns the
+    number of offices loaded.
+    """
     cursor = conn.cursor()
     
     try:
-        # Transform all offices
-        office_data = [transform_office(office) for office in offices]
+        # Transform lazily so rows are streamed straight into COPY
+        office_rows = (transform_office(office) for office in offices)
         
-        # Insert query with ON CONFLICT to handle duplicates
-        insert_query = """
-            INSERT INTO offices (
-                id, name, code, "addressId", phone, email,
-                capacity, status, "employerId", "managerId",
-                "createdAt", "updatedAt"
-            ) VALUES %s
-            ON CONFLICT (id) DO UPDATE SET
-                name = EXCLUDED.name,
-                code = EXCLUDED.code,
-                "addressId" = EXCLUDED."addressId",
-                phone = EXCLUDED.phone,
-                email = EXCLUDED.email,
-                capacity = EXCLUDED.capacity,
-                status = EXCLUDED.status,
-                "employerId" = EXCLUDED."employerId",
-                "managerId" = EXCLUDED."managerId",
-                "updatedAt" = EXCLUDED."updatedAt"
-        """
+        # Bulk load into staging with COPY, then upsert in a single statement
+        copied = copy_to_staging(cursor, office_rows)
+        cursor.execute(OFFICES_UPSERT_SQL)
         
-        # Execute batch insert
-        execute_values(cursor, insert_query, office_data)
-        
-        conn.commit()
-        print(f"✅ Successfully inserted/updated {len(office_data)} offices")
+        print(f"✅ Successfully inserted/updated {copied} offices")
         
         # Show summary
-        cursor.execute("SELECT COUNT(*) FROM offices")
-        total = cursor.fetchone()[0]
+        cursor.execute(OFFICES_SUMMARY_SQL)
+        summary = cursor.fetchall()
+        total = sum(count for _, count, _ in summary)
         print(f"📊 Total offices in database: {total}")
         
-        cursor.execute("SELECT status, COUNT(*) FROM offices GROUP BY status ORDER BY COUNT(*) DESC")
-        status_counts = cursor.fetchall()
-        if status_counts:
+        if summary:
             print("\n📈 Offices by status:")
-            for status, count in status_counts:
+            for status, count, _ in summary:
                 print(f"  {status or 'Unknown'}: {count}")
         
-        cursor.execute("SELECT COUNT(*) FROM offices WHERE \"addressId\" IS NOT NULL")
-        with_address = cursor.fetchone()[0]
+        with_address = sum(count for _, _, count in summary)
         print(f"\n🏢 Offices with addresses: {with_address}")
         
-    except Exception as e:
-        conn.rollback()
-        print(f"❌ Error inserting offices: {e}")
-        raise
+        return copied
     finally:
         cursor.close()
-        conn.close()
 
 
 def main():
@@ -277,7 +439,16 @@ def main():
             return
         
         # Populate database
-        populate_offices(offices)
+        conn = psycopg2.connect(DATABASE_URL)
+        try:
+            populate_offices(conn, offices)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error inserting offices: {e}")
+            raise
+        finally:
+            conn.close()
         
         print("\n✅ Office population complete!")
         
@@ -11,14 +11,32 @@ Usage:
 
 import os
 import sys
+import csv
+import io
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import psycopg2
-from psycopg2.extras import execute_values
 from datetime import datetime
-from decimal import Decimal
+from functools import lru_cache
+from decimal import Decimal, InvalidOperation
 from pathlib import Path
 from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import urllib3
+from urllib3.util.retry import Retry
+
+# orjson is optional; it is several times faster than json for the API pages
+# and the per-order shipping info
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    from json import loads as json_loads, dumps as json_dumps
 
 # Suppress InsecureRequestWarning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -32,100 +50,202 @@ WORKWIZE_KEY = os.getenv('WORKWIZE_KEY')
 DATABASE_URL = os.getenv('DATABASE_URL')
 WORKWIZE_BASE_URL = 'https://prod-back.goworkwize.com/api/public'
 
+# NULL marker for COPY (CSV format). COPY reads any unquoted \N as NULL and
+# csv.writer doesn't quote it, so a string value of exactly \N also loads as NULL.
+COPY_NULL = r'\N'
 
-def fetch_orders():
-    """Fetch all orders from Workwize API with pagination."""
-    all_orders = []
-    page = 1
+# Rows sent per COPY round trip while streaming into staging
+COPY_BATCH_SIZE = 1000
+
+# Concurrent page requests once the page count is known
+PAGE_FETCH_WORKERS = 16
+
+# Pages fetched ahead of the rows being copied into the database
+PAGE_PREFETCH = 2 * PAGE_FETCH_WORKERS
+
+# Shared HTTP session so pages reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({
+    'Authorization': f'Bearer {WORKWIZE_KEY}',
+    'Accept': 'application/json'
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=PAGE_FETCH_WORKERS,
+    pool_maxsize=PAGE_FETCH_WORKERS,
+    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+
+def fetch_orders_page(page):
+    """Fetch a single page of orders from the Workwize API."""
+    url = f'{WORKWIZE_BASE_URL}/orders?page={page}'
+    print(f"Fetching page {page} from {url}...")
     
-    headers = {
-        'Authorization': f'Bearer {WORKWIZE_KEY}',
-        'Accept': 'application/json'
-    }
+    response = SESSION.get(url, verify=False, timeout=30)
+    response.raise_for_status()
     
-    while True:
-        url = f'{WORKWIZE_BASE_URL}/orders?page={page}'
-        print(f"Fetching page {page} from {url}...")
-        
-        response = requests.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        
-        data = response.json()
+    return json_loads(response.content)
+
+
+def has_next_page(data, page):
+    """Check a page response's pagination info for a following page."""
+    meta = data.get('meta', {})
+    links = data.get('links', {})
+    
+    current_page = meta.get('current_page', page)
+    last_page = meta.get('last_page')
+    
+    return bool(links.get('next')) and not (last_page and current_page >= last_page)
+
+
+def iter_orders_pages():
+    """
+    Yield each page response from the Workwize API, in page order.
+    
+    Page 1 is fetched first to learn meta.last_page, then the remaining pages
+    are fetched concurrently, at most PAGE_PREFETCH ahead of the consumer. If
+    the API doesn't report a page count, pages are followed one at a time.
+    """
+    data = fetch_orders_page(1)
+    yield data
+    
+    # If it's just an array, no pagination
+    if not isinstance(data, dict) or not has_next_page(data, 1):
+        return
+    
+    last_page = data.get('meta', {}).get('last_page')
+    if last_page:
+        # Page count is known, so fetch the remaining pages concurrently
+        with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+            pending = deque()
+            for page in range(2, last_page + 1):
+                pending.append(executor.submit(fetch_orders_page, page))
+                if len(pending) >= PAGE_PREFETCH:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    else:
+        page = 1
+        while has_next_page(data, page):
+            page += 1
+            data = fetch_orders_page(page)
+            yield data
+
+
+def iter_orders():
+    """Yield all orders from the Workwize API, page by page as the pages arrive."""
+    fetched = 0
+    for page, data in enumerate(iter_orders_pages(), 1):
+        if not isinstance(data, dict):
+            fetched += len(data)
+            yield from data
+            continue
         
         # Handle different response formats
-        if isinstance(data, dict):
-            if 'data' in data:
-                orders = data['data']
-            elif 'value' in data:
-                orders = data['value']
-            else:
-                orders = [data]
-            
-            # Add to collection
-            all_orders.extend(orders)
-            
-            # Check pagination info
-            meta = data.get('meta', {})
-            links = data.get('links', {})
-            
-            current_page = meta.get('current_page', page)
-            last_page = meta.get('last_page')
-            total = meta.get('total', 0)
-            
-            print(f"  Page {current_page}: Fetched {len(orders)} orders (Total so far: {len(all_orders)}/{total})")
-            
-            # Check if there's a next page
-            if not links.get('next') or (last_page and current_page >= last_page):
-                break
-            
-            page += 1
+        if 'data' in data:
+            orders = data['data']
+        elif 'value' in data:
+            orders = data['value']
         else:
-            # If it's just an array, no pagination
-            all_orders = data
-            break
+            orders = [data]
+        
+        fetched += len(orders)
+        
+        meta = data.get('meta', {})
+        current_page = meta.get('current_page', page)
+        total = meta.get('total', 0)
+        
+        print(f"  Page {current_page}: Fetched {len(orders)} orders (Total so far: {fetched}/{total})")
+        yield from orders
     
-    print(f"\n✅ Fetched {len(all_orders)} total orders")
-    return all_orders
+    print(f"\n✅ Fetched {fetched} total orders")
+
+
+def fetch_orders():
+    """Fetch all orders from Workwize API with pagination."""
+    return list(iter_orders())
+
+
+@lru_cache(maxsize=1 << 16)
+def _parse_iso_str(date_str):
+    """Parse an ISO-8601 string; cached because many records share timestamps."""
+    try:
+        return datetime.fromisoformat(date_str[:-1] + '+00:00' if date_str.endswith('Z') else date_str)
+    except ValueError:
+        return None
+
+
+def _parse_iso(date_str):
+    """Parse an ISO-8601 timestamp from the API, returning None if it isn't valid."""
+    if not isinstance(date_str, str):
+        return None
+    return _parse_iso_str(date_str)
+
+
+def _first(obj, keys):
+    """Return the first truthy obj[key] for keys, like chaining obj.get(key) with `or`."""
+    value = None
+    for key in keys:
+        value = obj.get(key)
+        if value:
+            return value
+    return value
+
+
+# Amounts Postgres parses to the same value as Decimal, so they can go
+# through COPY unchanged
+_PLAIN_NUMBER_RE = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+
+# Fallback keys for fields the API has returned under different names
+_ORDER_NUMBER_KEYS = ('number', 'order_number')
+_DELIVERY_DATE_KEYS = ('delivery_date', 'deliveryDate')
+_TOTAL_AMOUNT_KEYS = ('total_amount', 'buy_subtotal')
+_NOTES_KEYS = ('notes', 'description')
+_PO_NUMBER_KEYS = ('po_number', 'poNumber')
+_TOTAL_PRODUCTS_KEYS = ('total_products', 'totalProducts')
+_SHIPPING_INFO_KEYS = ('shipping_info', 'shippingInfo')
+_CREATED_AT_KEYS = ('created_at', 'createdAt')
+_UPDATED_AT_KEYS = ('updated_at', 'updatedAt')
 
 
 def transform_order(order):
     """Transform API order data to database format."""
+    now = datetime.now()
+    
     # Extract basic data
     order_id = str(order.get('id', ''))
     
     # Order number
-    order_number = order.get('number') or order.get('order_number') or f"ORDER-{order_id}"
+    order_number = _first(order, _ORDER_NUMBER_KEYS) or f"ORDER-{order_id}"
     
     # Status
     status = order.get('status') or 'unknown'
     
     # Order date
-    order_date = datetime.now()
-    if order.get('created_at') or order.get('createdAt'):
-        date_str = order.get('created_at') or order.get('createdAt')
-        try:
-            order_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    order_date = now
+    date_str = _first(order, _CREATED_AT_KEYS)
+    if date_str:
+        order_date = _parse_iso(date_str) or now
     
     # Delivery date
     delivery_date = None
-    if order.get('delivery_date') or order.get('deliveryDate'):
-        date_str = order.get('delivery_date') or order.get('deliveryDate')
-        try:
-            delivery_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    date_str = _first(order, _DELIVERY_DATE_KEYS)
+    if date_str:
+        delivery_date = _parse_iso(date_str)
     
-    # Total amount
+    # Total amount - kept as a string, COPY parses it into the numeric column
     total_amount = None
-    if order.get('total_amount') or order.get('buy_subtotal'):
-        try:
-            amount_val = order.get('total_amount') or order.get('buy_subtotal')
-            if amount_val is not None:
-                total_amount = Decimal(str(amount_val))
-        except:
-            pass
+    amount_val = _first(order, _TOTAL_AMOUNT_KEYS)
+    if amount_val:
+        amount_str = str(amount_val)
+        if _PLAIN_NUMBER_RE.fullmatch(amount_str):
+            total_amount = amount_str
+        else:
+            # Let Decimal validate and normalise anything else (e.g. ' 12 ', 'NaN')
+            try:
+                total_amount = str(Decimal(amount_str))
+            except InvalidOperation:
+                pass
     
     # Currency - extract from dict if needed
     currency = None
@@ -138,40 +258,49 @@ def transform_order(order):
     
     # Customer ID - from actor/receiver
     customer_id = None
-    if order.get('actor'):
-        if isinstance(order['actor'], dict):
-            cust_id = order['actor'].get('id')
+    actor = order.get('actor')
+    if actor:
+        if isinstance(actor, dict):
+            cust_id = actor.get('id')
             if cust_id:
                 customer_id = str(cust_id)
-    elif order.get('customer_id'):
-        customer_id = str(order['customer_id'])
+    else:
+        cust_id = order.get('customer_id')
+        if cust_id:
+            customer_id = str(cust_id)
     
     # Employee ID - from receiver if type is employee
     employee_id = None
     receiver_type = order.get('receiver_type')
-    if receiver_type == 'employee' and order.get('receiver_id'):
-        employee_id = str(order['receiver_id'])
-    elif order.get('employee_id'):
-        employee_id = str(order['employee_id'])
+    receiver_id = order.get('receiver_id')
+    if receiver_type == 'employee' and receiver_id:
+        employee_id = str(receiver_id)
+    else:
+        emp_id = order.get('employee_id')
+        if emp_id:
+            employee_id = str(emp_id)
     
     # Warehouse ID
     warehouse_id = None
-    if order.get('warehouse'):
-        if isinstance(order['warehouse'], dict):
-            wh_id = order['warehouse'].get('id')
+    warehouse = order.get('warehouse')
+    if warehouse:
+        if isinstance(warehouse, dict):
+            wh_id = warehouse.get('id')
             if wh_id:
                 warehouse_id = str(wh_id)
         else:
-            warehouse_id = str(order['warehouse'])
-    elif order.get('warehouse_id'):
-        warehouse_id = str(order['warehouse_id'])
+            warehouse_id = str(warehouse)
+    else:
+        wh_id = order.get('warehouse_id')
+        if wh_id:
+            warehouse_id = str(wh_id)
     
     # Notes
-    notes = order.get('notes') or order.get('description')
+    notes = _first(order, _NOTES_KEYS)
     
     # New fields from API
-    po_number = order.get('po_number') or order.get('poNumber')
-    total_products = order.get('total_products') or order.get('totalProducts')
+    po_number = _first(order, _PO_NUMBER_KEYS)
+    total_products = _first(order, _TOTAL_PRODUCTS_KEYS)
     
     # Receiver info
     receiver = order.get('receiver')
@@ -180,25 +309,21 @@ def transform_order(order):
     express_delivery = order.get('express_delivery', False) or order.get('expressDelivery', False)
     
     # Shipping info - store as JSON string
-    import json
     shipping_info = None
-    if order.get('shipping_info') or order.get('shippingInfo'):
+    shipping_data = _first(order, _SHIPPING_INFO_KEYS)
+    if shipping_data:
         try:
-            shipping_data = order.get('shipping_info') or order.get('shippingInfo')
-            shipping_info = json.dumps(shipping_data)
+            shipping_info = json_dumps(shipping_data)
         except:
             pass
     
     # Timestamps
     created_at = order_date  # Use order date as created
     
-    updated_at = datetime.now()
-    if order.get('updated_at') or order.get('updatedAt'):
-        date_str = order.get('updated_at') or order.get('updatedAt')
-        try:
-            updated_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    updated_at = now
+    date_str = _first(order, _UPDATED_AT_KEYS)
+    if date_str:
+        updated_at = _parse_iso(date_str) or now
     
     return (
         order_id,
@@ -223,74 +348,172 @@ def transform_order(order):
     )
 
 
-def populate_orders(orders):
-    """Insert orders into PostgreSQL database."""
-    conn = psycopg2.connect(DATABASE_URL)
+# COPY staging table, in the same column order as the upsert. Timestamps are
+# timestamptz so API offsets are converted into the timestamp columns the same
+# way the parameterised INSERT converted them. seq records arrival order so the
+# upsert keeps the last row for an id that shows up on more than one page, as
+# the row-by-row upserts did.
+ORDERS_STAGING_SQL = """
+    CREATE TEMP TABLE staging_orders (
+        id text,
+        "orderNumber" text,
+        status text,
+        "orderDate" timestamptz,
+        "deliveryDate" timestamptz,
+        "totalAmount" numeric,
+        currency text,
+        "customerId" text,
+        "employeeId" text,
+        "warehouseId" text,
+        notes text,
+        "poNumber" text,
+        "totalProducts" numeric,
+        receiver text,
+        "receiverType" text,
+        "expressDelivery" boolean,
+        "shippingInfo" jsonb,
+        "createdAt" timestamptz,
+        "updatedAt" timestamptz,
+        seq bigserial
+    ) ON COMMIT DROP
+"""
+
+ORDERS_COPY_SQL = r"""
+    COPY staging_orders (
+        id, "orderNumber", status, "orderDate", "deliveryDate",
+        "totalAmount", currency, "customerId", "employeeId",
+        "warehouseId", notes, "poNumber", "totalProducts",
+        receiver, "receiverType", "expressDelivery", "shippingInfo",
+        "createdAt", "updatedAt"
+    ) FROM STDIN WITH (FORMAT csv, NULL '\N')
+"""
+
+ORDERS_UPSERT_SQL = """
+    INSERT INTO orders (
+        id, "orderNumber", status, "orderDate", "deliveryDate",
+        "totalAmount", currency, "customerId", "employeeId",
+        "warehouseId", notes, "poNumber", "totalProducts",
+        receiver, "receiverType", "expressDelivery", "shippingInfo",
+        "createdAt", "updatedAt"
+    )
+    SELECT DISTINCT ON (id)
+        id, "orderNumber", status, "orderDate", "deliveryDate",
+        "totalAmount", currency, "customerId", "employeeId",
+        "warehouseId", notes, "poNumber", "totalProducts",
+        receiver, "receiverType", "expressDelivery", "shippingInfo",
+        "createdAt", "updatedAt"
+    FROM staging_orders
+    ORDER BY id, seq DESC
+    ON CONFLICT (id) DO UPDATE SET
+        "orderNumber" = EXCLUDED."orderNumber",
+        status = EXCLUDED.status,
+        "orderDate" = EXCLUDED."orderDate",
+        "deliveryDate" = EXCLUDED."deliveryDate",
+        "totalAmount" = EXCLUDED."totalAmount",
+        currency = EXCLUDED.currency,
+        "customerId" = EXCLUDED."customerId",
+        "employeeId" = EXCLUDED."employeeId",
+        "warehouseId" = EXCLUDED."warehouseId",
+        notes = EXCLUDED.notes,
+        "poNumber" = EXCLUDED."poNumber",
+        "totalProducts" = EXCLUDED."totalProducts",
+        receiver = EXCLUDED.receiver,
+        "receiverType" = EXCLUDED."receiverType",
+        "expressDelivery" = EXCLUDED."expressDelivery",
+        "shippingInfo" = EXCLUDED."shippingInfo",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
+
+# Post-load summary: counts by status and by currency from a single scan of
+# orders. GROUPING(status) is 0 for the status rows and 1 for the currency rows.
+ORDERS_SUMMARY_SQL = """
+    SELECT GROUPING(status), status, currency, COUNT(*)
+    FROM orders
+    GROUP BY GROUPING SETS ((status), (currency))
+    ORDER BY 1, 4 DESC
+"""
+
+
+def _flush_copy_buffer(cursor, buffer):
+    """Send the buffered CSV rows to the staging table and reset the buffer."""
+    if not buffer.tell():
+        return
+    buffer.seek(0)
+    cursor.copy_expert(ORDERS_COPY_SQL, buffer)
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def copy_to_staging(cursor, rows):
+    """
+    Stream rows into the staging table with COPY FROM STDIN.
+    
+    rows can be any iterable; it is consumed COPY_BATCH_SIZE rows at a time so
+    only one batch of CSV is held in memory. Returns the number of rows copied.
+    """
+    cursor.execute(ORDERS_STAGING_SQL)
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    count = 0
+    for row in rows:
+        writer.writerow([COPY_NULL if value is None else value for value in row])
+        count += 1
+        if count % COPY_BATCH_SIZE == 0:
+            _flush_copy_buffer(cursor, buffer)
+    _flush_copy_buffer(cursor, buffer)
+    
+    return count
+
+
+def populate_orders(conn, orders):
+    """
+    Insert orders into PostgreSQL database using conn.
+    
+    orders can be any iterable of API records, e.g. iter_orders() to load pages
+    as they arrive. The caller owns the transaction: nothing is committed here,
+    so several populators can share one connection and commit together.
+    Returns the number of orders loaded.
+    """
     cursor = conn.cursor()
     
     try:
-        # Transform all orders
-        order_data = [transform_order(order) for order in orders]
+        # Transform lazily so rows are streamed straight into COPY
+        order_rows = (transform_order(order) for order in orders)
         
-        # Insert query with ON CONFLICT to handle duplicates
-        insert_query = """
-            INSERT INTO orders (
-                id, "orderNumber", status, "orderDate", "deliveryDate",
-                "totalAmount", currency, "customerId", "employeeId",
-                "warehouseId", notes, "poNumber", "totalProducts",
-                receiver, "receiverType", "expressDelivery", "shippingInfo",
-                "createdAt", "updatedAt"
-            ) VALUES %s
-            ON CONFLICT (id) DO UPDATE SET
-                "orderNumber" = EXCLUDED."orderNumber",
-                status = EXCLUDED.status,
-                "orderDate" = EXCLUDED."orderDate",
-                "deliveryDate" = EXCLUDED."deliveryDate",
-                "totalAmount" = EXCLUDED."totalAmount",
-                currency = EXCLUDED.currency,
-                "customerId" = EXCLUDED."customerId",
-                "employeeId" = EXCLUDED."employeeId",
-                "warehouseId" = EXCLUDED."warehouseId",
-                notes = EXCLUDED.notes,
-                "poNumber" = EXCLUDED."poNumber",
-                "totalProducts" = EXCLUDED."totalProducts",
-                receiver = EXCLUDED.receiver,
-                "receiverType" = EXCLUDED."receiverType",
-                "expressDelivery" = EXCLUDED."expressDelivery",
-                "shippingInfo" = EXCLUDED."shippingInfo",
-                "updatedAt" = EXCLUDED."updatedAt"
-        """
+        # Bulk load into staging with COPY, then upsert in a single statement
+        copied = copy_to_staging(cursor, order_rows)
+        if not copied:
+            print("⚠️  No orders found in API response")
+            return 0
         
-        # Execute batch insert
-        execute_values(cursor, insert_query, order_data)
+        cursor.execute(ORDERS_UPSERT_SQL)
         
-        conn.commit()
-        print(f"✅ Successfully inserted/updated {len(order_data)} orders")
+        print(f"✅ Successfully inserted/updated {copied} orders")
         
         # Show summary
-        cursor.execute("SELECT COUNT(*) FROM orders")
-        total = cursor.fetchone()[0]
+        cursor.execute(ORDERS_SUMMARY_SQL)
+        summary = cursor.fetchall()
+        status_counts = [(status, count) for by_currency, status, _, count in summary if not by_currency]
+        currency_counts = [
+            (currency, count) for by_currency, _, currency, count in summary
+            if by_currency and currency is not None
+        ]
+        
+        total = sum(count for _, count in status_counts)
         print(f"📊 Total orders in database: {total}")
         
-        cursor.execute("SELECT status, COUNT(*) FROM orders GROUP BY status ORDER BY COUNT(*) DESC")
-        status_counts = cursor.fetchall()
         print("\n📈 Orders by status:")
         for status, count in status_counts:
             print(f"  {status or 'Unknown'}: {count}")
         
-        cursor.execute("SELECT currency, COUNT(*) FROM orders WHERE currency IS NOT NULL GROUP BY currency ORDER BY COUNT(*) DESC")
-        currency_counts = cursor.fetchall()
         print("\n💰 Orders by currency:")
         for currency, count in currency_counts:
             print(f"  {currency}: {count}")
         
-    except Exception as e:
-        conn.rollback()
-        print(f"❌ Error inserting orders: {e}")
-        raise
+        return copied
     finally:
         cursor.close()
-        conn.close()
 
 
 def main():
@@ -309,15 +532,18 @@ def main():
         sys.exit(1)
     
     try:
-        # Fetch orders from API
-        orders = fetch_orders()
-        
-        if not orders:
-            print("⚠️  No orders found in API response")
-            return
-        
-        # Populate database
-        populate_orders(orders)
+        # Fetch orders from API and stream them into the database as the
+        # pages arrive, so the COPY overlaps the remaining page fetches
+        conn = psycopg2.connect(DATABASE_URL)
+        try:
+            populate_orders(conn, iter_orders())
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error inserting orders: {e}")
+            raise
+        finally:
+            conn.close()
         
         print("\n✅ Order population complete!")
         
@@ -10,17 +10,19 @@ Usage:
 
 import os
 import sys
+import csv
+import io
 import requests
+from requests.adapters import HTTPAdapter
 import psycopg2
-from psycopg2.extras import execute_values
 from datetime import datetime
-from decimal import Decimal
+from functools import lru_cache
+from decimal import Decimal, InvalidOperation
 from dotenv import load_dotenv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import re
-import urllib3
-
-# Suppress InsecureRequestWarning
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from urllib3.util.retry import Retry
 
 # Load environment variables
 load_dotenv()
@@ -30,72 +32,161 @@ WORKWIZE_KEY = os.getenv('WORKWIZE_KEY')
 DATABASE_URL = os.getenv('DATABASE_URL')
 WORKWIZE_BASE_URL = 'https://prod-back.goworkwize.com/api/public'
 
+# NULL marker for COPY (CSV format). COPY reads any unquoted \N as NULL and
+# csv.writer doesn't quote it, so a string value of exactly \N also loads as NULL.
+COPY_NULL = r'\N'
+
+# Rows sent per COPY round trip while streaming into staging
+COPY_BATCH_SIZE = 1000
+
+# Concurrent page requests once the page count is known
+PAGE_FETCH_WORKERS = 16
+
+# Pages fetched ahead of the database load, bounding how many are held in memory
+PAGE_PREFETCH = 2 * PAGE_FETCH_WORKERS
+
+# Shared HTTP session so pages reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({
+    'Authorization': f'Bearer {WORKWIZE_KEY}',
+    'Accept': 'application/json'
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=PAGE_FETCH_WORKERS,
+    pool_maxsize=PAGE_FETCH_WORKERS,
+    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+
+# Same matches as '<.*?>' (a tag can't span lines) without the lazy backtracking
+_HTML_TAG_RE = re.compile(r'<[^>\n]*>')
+
+# Prices Postgres parses to the same value as Decimal, so they can go
+# through COPY unchanged
+_PLAIN_NUMBER_RE = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+
 
 def strip_html(text):
     """Strip HTML tags from text."""
     if not text:
         return None
-    clean = re.compile('<.*?>')
-    return re.sub(clean, '', text).strip()
+    if '<' not in text:
+        return text.strip()
+    return _HTML_TAG_RE.sub('', text).strip()
 
 
-def fetch_products():
-    """Fetch all products from Workwize API with pagination."""
-    all_products = []
-    page = 1
+def fetch_products_page(page):
+    """Fetch a single page of products from the Workwize API."""
+    url = f'{WORKWIZE_BASE_URL}/products?page={page}'
+    print(f"Fetching page {page} from {url}...")
     
-    headers = {
-        'Authorization': f'Bearer {WORKWIZE_KEY}',
-        'Accept': 'application/json'
-    }
+    response = SESSION.get(url, timeout=30)
+    response.raise_for_status()
     
-    while True:
-        url = f'{WORKWIZE_BASE_URL}/products?page={page}'
-        print(f"Fetching page {page} from {url}...")
-        
-        response = requests.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        
-        data = response.json()
+    return response.json()
+
+
+def has_next_page(data, page):
+    """Check a page response's pagination info for a following page."""
+    meta = data.get('meta', {})
+    links = data.get('links', {})
+    
+    current_page = meta.get('current_page', page)
+    last_page = meta.get('last_page')
+    
+    return bool(links.get('next')) and not (last_page and current_page >= last_page)
+
+
+def iter_products_pages():
+    """
+    Yield each page response from the Workwize API, in page order.
+    
+    Page 1 is fetched first to learn meta.last_page, then the remaining pages
+    are fetched concurrently, at most PAGE_PREFETCH ahead of the consumer. If
+    the API doesn't report a page count, pages are followed one at a time.
+    """
+    data = fetch_products_page(1)
+    yield data
+    
+    # If it's just an array, no pagination
+    if not isinstance(data, dict) or not has_next_page(data, 1):
+        return
+    
+    last_page = data.get('meta', {}).get('last_page')
+    if last_page:
+        # Page count is known, so fetch the remaining pages concurrently
+        with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+            pending = deque()
+            for page in range(2, last_page + 1):
+                pending.append(executor.submit(fetch_products_page, page))
+                if len(pending) >= PAGE_PREFETCH:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    else:
+        page = 1
+        while has_next_page(data, page):
+            page += 1
+            data = fetch_products_page(page)
+            yield data
+
+
+def iter_products():
+    """Yield all products from the Workwize API, page by page as the pages arrive."""
+    fetched = 0
+    for page, data in enumerate(iter_products_pages(), 1):
+        if not isinstance(data, dict):
+            fetched += len(data)
+            yield from data
+            continue
         
         # Handle different response formats
-        if isinstance(data, dict):
-            if 'data' in data:
-                products = data['data']
-            elif 'value' in data:
-                products = data['value']
-            else:
-                products = [data]
-            
-            # Add to collection
-            all_products.extend(products)
-            
-            # Check pagination info
-            meta = data.get('meta', {})
-            links = data.get('links', {})
-            
-            current_page = meta.get('current_page', page)
-            last_page = meta.get('last_page')
-            total = meta.get('total', 0)
-            
-            print(f"  Page {current_page}: Fetched {len(products)} products (Total so far: {len(all_products)}/{total})")
-            
-            # Check if there's a next page
-            if not links.get('next') or (last_page and current_page >= last_page):
-                break
-            
-            page += 1
+        if 'data' in data:
+            products = data['data']
+        elif 'value' in data:
+            products = data['value']
         else:
-            # If it's just an array, no pagination
-            all_products = data
-            break
+            products = [data]
+        
+        fetched += len(products)
+        
+        meta = data.get('meta', {})
+        current_page = meta.get('current_page', page)
+        total = meta.get('total', 0)
+        
+        print(f"  Page {current_page}: Fetched {len(products)} products (Total so far: {fetched}/{total})")
+        yield from products
     
-    print(f"\n✅ Fetched {len(all_products)} total products")
-    return all_products
+    print(f"\n✅ Fetched {fetched} total products")
+
+
+def fetch_products():
+    """Fetch all products from Workwize API with pagination."""
+    return list(iter_products())
+
+
+@lru_cache(maxsize=1 << 16)
+def _parse_iso_str(date_str):
+    """Parse an ISO-8601 string; cached because many records share timestamps."""
+    try:
+        return datetime.fromisoformat(date_str[:-1] + '+00:00' if date_str.endswith('Z') else date_str)
+    except ValueError:
+        return None
 
 
-def transform_product(product):
-    """Transform API product data to database format."""
+def _parse_iso(date_str):
+    """Parse an ISO-8601 timestamp from the API, returning None if it isn't valid."""
+    if not isinstance(date_str, str):
+        return None
+    return _parse_iso_str(date_str)
+
+
+def transform_product(product, now):
+    """
+    Transform API product data to database format.
+    
+    now is the load's timestamp, used when the API gives no created/updated date.
+    """
     # Extract basic data
     product_id = str(product.get('id', ''))
     
@@ -126,9 +217,7 @@ def transform_product(product):
     manufacturer = product.get('manufacturer') or product.get('brand')
     if not manufacturer and name:
         # Try to extract first word from name (often the brand)
-        parts = name.split(',')
-        if parts:
-            manufacturer = parts[0].strip()
+        manufacturer = name.partition(',')[0].strip()
     
     # Model
     model = product.get('model')
@@ -137,13 +226,18 @@ def transform_product(product):
     price = None
     currency = None
     
-    # Try different price fields
+    # Try different price fields - kept as a string, COPY parses it into the numeric column
     price_val = product.get('price') or product.get('buy_price') or product.get('rental_price')
     if price_val:
-        try:
-            price = Decimal(str(price_val))
-        except:
-            pass
+        price_str = str(price_val)
+        if _PLAIN_NUMBER_RE.fullmatch(price_str):
+            price = price_str
+        else:
+            # Let Decimal validate and normalise anything else (e.g. ' 12 ', 'NaN')
+            try:
+                price = str(Decimal(price_str))
+            except InvalidOperation:
+                pass
     
     # Get currency
     currency_data = product.get('currency')
@@ -162,25 +256,19 @@ def transform_product(product):
     if stock_val:
         try:
             stock_quantity = int(stock_val)
-        except:
+        except (TypeError, ValueError, OverflowError):
             pass
     
     # Timestamps
-    created_at = datetime.now()
-    if product.get('created_at') or product.get('createdAt'):
-        date_str = product.get('created_at') or product.get('createdAt')
-        try:
-            created_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    created_at = now
+    date_str = product.get('created_at') or product.get('createdAt')
+    if date_str:
+        created_at = _parse_iso(date_str) or now
     
-    updated_at = datetime.now()
-    if product.get('updated_at') or product.get('updatedAt'):
-        date_str = product.get('updated_at') or product.get('updatedAt')
-        try:
-            updated_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    updated_at = now
+    date_str = product.get('updated_at') or product.get('updatedAt')
+    if date_str:
+        updated_at = _parse_iso(date_str) or now
     
     return (
         product_id,
@@ -199,54 +287,135 @@ def transform_product(product):
     )
 
 
+def dedupe_skus(rows):
+    """
+    Yield product rows with duplicate SKUs made unique.
+    
+    The first product with a SKU keeps it; later ones get their product ID
+    appended. Rows without a duplicate SKU are passed through untouched.
+    """
+    seen_skus = set()
+    for row in rows:
+        sku = row[2]
+        if sku:
+            if sku in seen_skus:
+                # Append product ID to make SKU unique
+                row = (row[0], row[1], f"{sku}-{row[0]}", *row[3:])
+            else:
+                seen_skus.add(sku)
+        yield row
+
+
+# COPY staging table, in the same column order as the upsert. Timestamps are
+# timestamptz so API offsets are converted into the timestamp columns the same
+# way the parameterised INSERT converted them. seq records arrival order so the
+# upsert keeps the last row for an id that shows up on more than one page, as
+# the row-by-row upserts did.
+PRODUCTS_STAGING_SQL = """
+    CREATE TEMP TABLE staging_products (
+        id text,
+        name text,
+        sku text,
+        category text,
+        description text,
+        manufacturer text,
+        model text,
+        price numeric,
+        currency text,
+        status text,
+        "stockQuantity" integer,
+        "createdAt" timestamptz,
+        "updatedAt" timestamptz,
+        seq bigserial
+    ) ON COMMIT DROP
+"""
+
+PRODUCTS_COPY_SQL = r"""
+    COPY staging_products (
+        id, name, sku, category, description, manufacturer,
+        model, price, currency, status, "stockQuantity",
+        "createdAt", "updatedAt"
+    ) FROM STDIN WITH (FORMAT csv, NULL '\N')
+"""
+
+PRODUCTS_UPSERT_SQL = """
+    INSERT INTO products (
+        id, name, sku, category, description, manufacturer,
+        model, price, currency, status, "stockQuantity",
+        "createdAt", "updatedAt"
+    )
+    SELECT DISTINCT ON (id)
+        id, name, sku, category, description, manufacturer,
+        model, price, currency, status, "stockQuantity",
+        "createdAt", "updatedAt"
+    FROM staging_products
+    ORDER BY id, seq DESC
+    ON CONFLICT (id) DO UPDATE SET
+        name = EXCLUDED.name,
+        sku = EXCLUDED.sku,
+        category = EXCLUDED.category,
+        description = EXCLUDED.description,
+        manufacturer = EXCLUDED.manufacturer,
+        model = EXCLUDED.model,
+        price = EXCLUDED.price,
+        currency = EXCLUDED.currency,
+        status = EXCLUDED.status,
+        "stockQuantity" = EXCLUDED."stockQuantity",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
+
+
+def _flush_copy_buffer(cursor, buffer):
+    """Send the buffered CSV rows to the staging table and reset the buffer."""
+    if not buffer.tell():
+        return
+    buffer.seek(0)
+    cursor.copy_expert(PRODUCTS_COPY_SQL, buffer)
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def copy_to_staging(cursor, rows):
+    """
+    Stream rows into the staging table with COPY FROM STDIN.
+    
+    rows can be any iterable; it is consumed COPY_BATCH_SIZE rows at a time so
+    only one batch of CSV is held in memory. Returns the number of rows copied.
+    """
+    cursor.execute(PRODUCTS_STAGING_SQL)
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    count = 0
+    for row in rows:
+        writer.writerow([COPY_NULL if value is None else value for value in row])
+        count += 1
+        if count % COPY_BATCH_SIZE == 0:
+            _flush_copy_buffer(cursor, buffer)
+    _flush_copy_buffer(cursor, buffer)
+    
+    return count
+
+
 def populate_products(products):
     """Insert products into PostgreSQL database."""
     conn = psycopg2.connect(DATABASE_URL)
     cursor = conn.cursor()
     
     try:
-        # Transform all products
-        product_data = [transform_product(product) for product in products]
-        
-        # First, handle duplicate SKUs by appending product ID
-        seen_skus = {}
-        cleaned_data = []
-        for row in product_data:
-            product_id, name, sku, *rest = row
-            if sku:
-                if sku in seen_skus:
-                    # Append product ID to make SKU unique
-                    sku = f"{sku}-{product_id}"
-                else:
-                    seen_skus[sku] = True
-            cleaned_data.append((product_id, name, sku, *rest))
-        
-        # Insert query with ON CONFLICT to handle duplicates
-        insert_query = """
-            INSERT INTO products (
-                id, name, sku, category, description, manufacturer,
-                model, price, currency, status, "stockQuantity",
-                "createdAt", "updatedAt"
-            ) VALUES %s
-            ON CONFLICT (id) DO UPDATE SET
-                name = EXCLUDED.name,
-                sku = EXCLUDED.sku,
-                category = EXCLUDED.category,
-                description = EXCLUDED.description,
-                manufacturer = EXCLUDED.manufacturer,
-                model = EXCLUDED.model,
-                price = EXCLUDED.price,
-                currency = EXCLUDED.currency,
-                status = EXCLUDED.status,
-                "stockQuantity" = EXCLUDED."stockQuantity",
-                "updatedAt" = EXCLUDED."updatedAt"
-        """
+        # Transform lazily so rows are streamed straight into COPY
+        now = datetime.now()
+        product_rows = dedupe_skus(transform_product(product, now) for product in products)
         
-        # Execute batch insert
-        execute_values(cursor, insert_query, cleaned_data)
+        # Bulk load into staging with COPY, then upsert in a single statement
+        copied = copy_to_staging(cursor, product_rows)
+        if not copied:
+            print("⚠️  No products found in API response")
+            return
+        cursor.execute(PRODUCTS_UPSERT_SQL)
         
         conn.commit()
-        print(f"✅ Successfully inserted/updated {len(cleaned_data)} products")
+        print(f"✅ Successfully inserted/updated {copied} products")
         
         # Show summary
         cursor.execute("SELECT COUNT(*) FROM products")
@@ -292,15 +461,9 @@ def main():
         sys.exit(1)
     
     try:
-        # Fetch products from API
-        products = fetch_products()
-        
-        if not products:
-            print("⚠️  No products found in API response")
-            return
-        
-        # Populate database
-        populate_products(products)
+        # Fetch products from API and stream them into the database as the
+        # pages arrive, so the COPY overlaps the remaining page fetches
+        populate_products(iter_products())
         
         print("\n✅ Product population complete!")
         
@@ -11,15 +11,15 @@ Usage:
 import os
 import sys
 import requests
+from requests.adapters import HTTPAdapter
 import psycopg2
 from psycopg2.extras import execute_values
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
-import urllib3
-
-# Suppress InsecureRequestWarning
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
 
 # Load environment variables from project root
 project_root = Path(__file__).parent.parent
@@ -35,64 +35,122 @@ if not WORKWIZE_KEY:
     print("ERROR: WORKWIZE_KEY not found in environment variables!")
     sys.exit(1)
 
+# Concurrent page requests once the page count is known
+PAGE_FETCH_WORKERS = 16
+
+# Shared HTTP session so pages reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({
+    'Authorization': f'Bearer {WORKWIZE_KEY}',
+    'Accept': 'application/json'
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=PAGE_FETCH_WORKERS,
+    pool_maxsize=PAGE_FETCH_WORKERS,
+    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+
+def fetch_warehouses_page(page):
+    """Fetch a single page of warehouses from the Workwize API."""
+    url = f'{WORKWIZE_BASE_URL}/warehouses?page={page}&include=countries'
+    print(f"Fetching page {page} from {url}...")
+    
+    response = SESSION.get(url, timeout=30)
+    response.raise_for_status()
+    
+    return response.json()
+
+
+def has_next_page(data, page):
+    """Check a page response's pagination info for a following page."""
+    meta = data.get('meta', {})
+    links = data.get('links', {})
+    
+    current_page = meta.get('current_page', page)
+    last_page = meta.get('last_page')
+    
+    return bool(links.get('next')) and not (last_page and current_page >= last_page)
+
 
 def fetch_warehouses():
-    """Fetch all warehouses from Workwize API with pagination."""
-    all_warehouses = []
-    page = 1
+    """Fetch all warehouses from Workwize API with pagination.
+    
+    Page 1 is fetched first to learn meta.last_page, then the remaining pages
+    are fetched concurrently. If the API doesn't report a page count, pages
+    are followed one at a time instead.
+    """
+    data = fetch_warehouses_page(1)
+    
+    # If it's just an array, no pagination
+    if not isinstance(data, dict):
+        print(f"\n✅ Fetched {len(data)} total warehouses")
+        return data
     
-    headers = {
-        'Authorization': f'Bearer {WORKWIZE_KEY}',
-        'Accept': 'application/json'
-    }
+    pages = [data]
+    last_page = data.get('meta', {}).get('last_page')
     
-    while True:
-        url = f'{WORKWIZE_BASE_URL}/warehouses?page={page}&include=countries'
-        print(f"Fetching page {page} from {url}...")
+    if has_next_page(data, 1):
+        if last_page:
+            # Page count is known, so fetch the remaining pages concurrently
+            with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+                pages.extend(executor.map(fetch_warehouses_page, range(2, last_page + 1)))
+        else:
+            page = 1
+            while has_next_page(data, page):
+                page += 1
+                data = fetch_warehouses_page(page)
+                pages.append(data)
+    
+    all_warehouses = []
+    for page, data in enumerate(pages, 1):
+        # Handle different response formats
+        if 'data' in data:
+            warehouses = data['data']
+        elif 'value' in data:
+            warehouses = data['value']
+        else:
+            warehouses = [data]
         
-        response = requests.get(url, headers=headers, verify=False)
-        response.raise_for_status()
+        # Add to collection
+        all_warehouses.extend(warehouses)
         
-        data = response.json()
+        meta = data.get('meta', {})
+        current_page = meta.get('current_page', page)
+        total = meta.get('total', 0)
         
-        # Handle different response formats
-        if isinstance(data, dict):
-            if 'data' in data:
-                warehouses = data['data']
-            elif 'value' in data:
-                warehouses = data['value']
-            else:
-                warehouses = [data]
-            
-            # Add to collection
-            all_warehouses.extend(warehouses)
-            
-            # Check pagination info
-            meta = data.get('meta', {})
-            links = data.get('links', {})
-            
-            current_page = meta.get('current_page', page)
-            last_page = meta.get('last_page')
-            total = meta.get('total', 0)
-            
-            print(f"  Page {current_page}: Fetched {len(warehouses)} warehouses (Total so far: {len(all_warehouses)}/{total})")
-            
-            # Check if there's a next page
-            if not links.get('next') or (last_page and current_page >= last_page):
-                break
-            
-            page += 1
-        else:
-            # If it's just an array, no pagination
-            all_warehouses = data
-            break
+        print(f"  Page {current_page}: Fetched {len(warehouses)} warehouses (Total so far: {len(all_warehouses)}/{total})")
     
     print(f"\n✅ Fetched {len(all_warehouses)} total warehouses")
     return all_warehouses
 
 
-def transform_warehouse(warehouse, cursor):
-    """Transform API warehouse data to database format."""
+@lru_cache(maxsize=1 << 16)
+def _parse_iso_str(date_str):
+    """Parse an ISO-8601 string; cached because many records share timestamps."""
+    try:
+        return datetime.fromisoformat(date_str[:-1] + '+00:00' if date_str.endswith('Z') else date_str)
+    except ValueError:
+        return None
+
+
+def _parse_iso(date_str):
+    """Parse an ISO-8601 timestamp from the API, returning None if it isn't valid."""
+    if not isinstance(date_str, str):
+        return None
+    return _parse_iso_str(date_str)
+
+
+def transform_warehouse(warehouse, now):
+    """
+    Transform API warehouse data to database format.
+    
+    now is the load's timestamp, used when the API gives no created/updated
+    date and for the warehouse's address row.
+    
+    Returns (warehouse_row, address_row), where address_row is None if the
+    warehouse has no countries to build an address from.
+    """
     # Extract basic data
     warehouse_id = str(warehouse.get('id', ''))
     
@@ -104,6 +162,7 @@ def transform_warehouse(warehouse, cursor):
     
     # Handle countries - use first country as primary address location
     address_id = None
+    address_row = None
     countries = warehouse.get('countries', [])
     if countries and len(countries) > 0:
         primary_country = countries[0]
@@ -113,22 +172,15 @@ def transform_warehouse(warehouse, cursor):
         # Create an address record for this warehouse using warehouse code as identifier
         address_id = f"warehouse_{warehouse_id}"
         
-        # Insert/update address
-        cursor.execute("""
-            INSERT INTO addresses (id, country, "postalCode", "createdAt", "updatedAt")
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (id) DO UPDATE SET
-                country = EXCLUDED.country,
-                "postalCode" = EXCLUDED."postalCode",
-                "updatedAt" = EXCLUDED."updatedAt"
-        """, (address_id, country_name, code, datetime.now(), datetime.now()))
+        # Address is upserted in bulk before the warehouses
+        address_row = (address_id, country_name, code, now, now)
     
     # Capacity
     capacity = warehouse.get('capacity') or warehouse.get('max_capacity')
     if capacity:
         try:
             capacity = int(capacity)
-        except:
+        except (TypeError, ValueError, OverflowError):
             capacity = None
     
     # Status
@@ -138,26 +190,20 @@ def transform_warehouse(warehouse, cursor):
     warehouse_type = warehouse.get('type') or warehouse.get('warehouse_provider')
     
     # Timestamps
-    created_at = datetime.now()
-    if warehouse.get('created_at') or warehouse.get('createdAt'):
-        date_str = warehouse.get('created_at') or warehouse.get('createdAt')
-        try:
-            created_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    created_at = now
+    date_str = warehouse.get('created_at') or warehouse.get('createdAt')
+    if date_str:
+        created_at = _parse_iso(date_str) or now
     
     # New field from API
     warehouse_provider = warehouse.get('warehouse_provider') or warehouse.get('warehouseProvider', 'logistic_plus')
     
-    updated_at = datetime.now()
-    if warehouse.get('updated_at') or warehouse.get('updatedAt'):
-        date_str = warehouse.get('updated_at') or warehouse.get('updatedAt')
-        try:
-            updated_at = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            pass
+    updated_at = now
+    date_str = warehouse.get('updated_at') or warehouse.get('updatedAt')
+    if date_str:
+        updated_at = _parse_iso(date_str) or now
     
-    return (
+    warehouse_row = (
         warehouse_id,
         name,
         code,
@@ -169,6 +215,35 @@ def transform_warehouse(warehouse, cursor):
         created_at,
         updated_at
     )
+    
+    return warehouse_row, address_row
+
+
+# Warehouse addresses are upserted first so the warehouses can reference them
+WAREHOUSE_ADDRESSES_UPSERT_SQL = """
+    INSERT INTO addresses (id, country, "postalCode", "createdAt", "updatedAt")
+    VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        country = EXCLUDED.country,
+        "postalCode" = EXCLUDED."postalCode",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
+
+WAREHOUSES_UPSERT_SQL = """
+    INSERT INTO warehouses (
+        id, name, code, "addressId", capacity, status,
+        type, "warehouseProvider", "createdAt", "updatedAt"
+    ) VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        name = EXCLUDED.name,
+        code = EXCLUDED.code,
+        "addressId" = EXCLUDED."addressId",
+        capacity = EXCLUDED.capacity,
+        status = EXCLUDED.status,
+        type = EXCLUDED.type,
+        "warehouseProvider" = EXCLUDED."warehouseProvider",
+        "updatedAt" = EXCLUDED."updatedAt"
+"""
 
 
 def populate_warehouses(warehouses):
@@ -178,27 +253,21 @@ def populate_warehouses(warehouses):
     
     try:
         # Transform all warehouses
-        warehouse_data = [transform_warehouse(warehouse, cursor) for warehouse in warehouses]
+        now = datetime.now()
+        # Both keyed by id so a repeated warehouse keeps its last row and
+        # address, as the row-by-row upserts did
+        warehouse_data = {}
+        address_data = {}
+        for warehouse in warehouses:
+            warehouse_row, address_row = transform_warehouse(warehouse, now)
+            warehouse_data[warehouse_row[0]] = warehouse_row
+            if address_row:
+                address_data[address_row[0]] = address_row
         
-        # Insert query with ON CONFLICT to handle duplicates
-        insert_query = """
-            INSERT INTO warehouses (
-                id, name, code, "addressId", capacity, status,
-                type, "warehouseProvider", "createdAt", "updatedAt"
-            ) VALUES %s
-            ON CONFLICT (id) DO UPDATE SET
-                name = EXCLUDED.name,
-                code = EXCLUDED.code,
-                "addressId" = EXCLUDED."addressId",
-                capacity = EXCLUDED.capacity,
-                status = EXCLUDED.status,
-                type = EXCLUDED.type,
-                "warehouseProvider" = EXCLUDED."warehouseProvider",
-                "updatedAt" = EXCLUDED."updatedAt"
-        """
+        execute_values(cursor, WAREHOUSE_ADDRESSES_UPSERT_SQL, list(address_data.values()), page_size=1000)
         
         # Execute batch insert
-        execute_values(cursor, insert_query, warehouse_data)
+        execute_values(cursor, WAREHOUSES_UPSERT_SQL, list(warehouse_data.values()))
         
         conn.commit()
         print(f"✅ Successfully inserted/updated {len(warehouse_data)} warehouses")
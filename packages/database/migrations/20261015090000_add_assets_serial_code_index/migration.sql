@@ -0,0 +1,2 @@
+-- CreateIndex
+CREATE INDEX "assets_serialCode_idx" ON "assets"("serialCode");
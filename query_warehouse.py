@@ -4,8 +4,24 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-cur = conn.cursor()
+SERIAL_CODE = 'CR8QCY3'
+
+# Rows per round trip when streaming matches from the database
+ASSET_FETCH_SIZE = 500
+
+conn = psycopg2.connect(
+    os.getenv('DATABASE_URL'),
+    connect_timeout=3,
+    keepalives=1,
+    keepalives_idle=5,
+    keepalives_interval=2,
+    keepalives_count=3,
+    application_name='query_warehouse',
+    options='-c statement_timeout=15000',
+)
+# Server-side cursor so matches stream in batches and print as they arrive
+cur = conn.cursor(name='asset_warehouse_lookup')
+cur.itersize = ASSET_FETCH_SIZE
 
 # Search for asset by serial number and get warehouse info
 cur.execute("""
@@ -15,28 +31,28 @@ cur.execute("""
     FROM assets a
     LEFT JOIN warehouses w ON a."warehouseId" = w.id
     LEFT JOIN addresses wa ON w."addressId" = wa.id
-    WHERE a."serialCode" ILIKE %s
-""", ('%CR8QCY3%',))
-
-result = cur.fetchall()
-columns = [desc[0] for desc in cur.description]
-
-if result:
-    print(f"\nFound asset with serial number CR8QCY3:\n")
-    for r in result:
-        print(f"Asset ID: {r[0]}")
-        print(f"Asset Tag: {r[1]}")
-        print(f"Asset Name: {r[2]}")
-        print(f"Serial Code: {r[3]}")
-        print(f"Status: {r[4]}")
-        print(f"\nWarehouse Information:")
-        print(f"  Warehouse ID: {r[5]}")
-        print(f"  Warehouse Name: {r[6]}")
-        print(f"  Warehouse Code: {r[7]}")
-        print(f"  Location: {r[8]}, {r[9]}, {r[10]}")
-        print(f"  Postal Code: {r[11]}")
-else:
-    print("No asset found with serial number CR8QCY3")
+    WHERE a."serialCode" = %s
+""", (SERIAL_CODE,))
+
+found = False
+for r in cur:
+    if not found:
+        print(f"\nFound asset with serial number {SERIAL_CODE}:\n")
+        found = True
+    print(f"Asset ID: {r[0]}")
+    print(f"Asset Tag: {r[1]}")
+    print(f"Asset Name: {r[2]}")
+    print(f"Serial Code: {r[3]}")
+    print(f"Status: {r[4]}")
+    print(f"\nWarehouse Information:")
+    print(f"  Warehouse ID: {r[5]}")
+    print(f"  Warehouse Name: {r[6]}")
+    print(f"  Warehouse Code: {r[7]}")
+    print(f"  Location: {r[8]}, {r[9]}, {r[10]}")
+    print(f"  Postal Code: {r[11]}")
+
+if not found:
+    print(f"No asset found with serial number {SERIAL_CODE}")
 
 cur.close()
 conn.close()